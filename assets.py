@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import os
+import re
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Asset:
+    def __init__(self, name, data, mimetype):
+        self.name = name
+        self.data = data
+        self.mimetype = mimetype
+        self.digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+        stem, extension = os.path.splitext(name)
+        self.fileName = "{}.{}{}".format(stem, self.digest, extension)
+        self.encodings = dict()
+
+    def compress(self):
+        # a variant is kept only when it saves a noticeable amount
+        variants = {"gzip": gzip.compress(self.data, 9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(self.data)
+        for encoding, data in variants.items():
+            if len(data) < len(self.data) * 0.9:
+                self.encodings[encoding] = data
+
+    def getVariant(self, acceptEncoding):
+        accepted = getAcceptedEncodings(acceptEncoding)
+        for encoding in preferredEncodings:
+            if encoding in accepted and encoding in self.encodings:
+                return self.encodings[encoding], encoding
+        return self.data, None
+
+
+def getAcceptedEncodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        fields = part.strip().split(";")
+        quality = 1.0
+        for field in fields[1:]:
+            key, _, value = field.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if fields[0] and quality > 0:
+            accepted.add(fields[0].strip().lower())
+    return accepted
+
+
+class AssetPipeline:
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = dict()
+        self.files = dict()
+
+    def build(self):
+        names = sorted(name for name in os.listdir(self.directory)
+                       if os.path.splitext(name)[1] in assetTypes)
+        # stylesheets are hashed last, after the files they refer to
+        names.sort(key=lambda name: name.endswith(".css"))
+        for name in names:
+            with open(os.path.join(self.directory, name), "rb") as source:
+                data = source.read()
+            if name.endswith(".css"):
+                data = self.rewriteUrls(data.decode()).encode()
+            asset = Asset(name, data, assetTypes[os.path.splitext(name)[1]])
+            asset.compress()
+            self.assets[name] = asset
+            self.files[asset.fileName] = asset
+        return self
+
+    def rewriteUrls(self, text):
+        def replace(match):
+            asset = self.assets.get(match.group(2))
+            if asset is None:
+                return match.group(0)
+            return "url({}{}{})".format(match.group(1), asset.fileName,
+                                        match.group(1))
+        return urlPattern.sub(replace, text)
+
+    def getUrl(self, name):
+        return urlPrefix + self.assets[name].fileName
+
+    def findFile(self, fileName):
+        return self.files.get(fileName)
+
+
+assetTypes = {
+    ".css": "text/css",
+    ".ico": "image/x-icon",
+    ".ttf": "font/ttf"
+}
+preferredEncodings = ["br", "gzip"]
+urlPattern = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+urlPrefix = "/assets/"
+immutable = "public, max-age=31536000, immutable"
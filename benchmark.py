@@ -0,0 +1,221 @@
+import argparse
+import os
+import time
+from random import seed
+import mechanics
+import profiling
+import simulation
+
+
+def measureTurns(rules, turns):
+    deckGenerator = mechanics.DeckGenerator(rules)
+    player1 = mechanics.AI("First AI", 0, rules)
+    player2 = mechanics.AI("Second AI", 0, rules)
+    setupStart = time.perf_counter()
+    player1.generateDeck(deckGenerator)
+    player2.generateDeck(deckGenerator)
+    setup = time.perf_counter() - setupStart
+
+    start = time.perf_counter()
+    for i in range(turns):
+        for player, opponent in [(player1, player2), (player2, player1)]:
+            # every other turn is a finishing search against a passed player
+            unit = player.makeTurn(opponent, i % 2 == 1)
+            if unit != 0:
+                unit.play()
+            else:
+                player.drawCard()
+            player.countUnits()
+        if i % 10 == 9:
+            player1.clearRows()
+            player2.clearRows()
+    return (time.perf_counter() - start) / (2 * turns), setup
+
+
+def runScaling(arguments):
+    header = "{:>8}{:>8}{:>10}{:>14}{:>12}"
+    print(header.format("rows", "hand", "deck", "us per turn", "setup ms"))
+    # with few rows every row holds a large part of the hand
+    for rowScale in [True, False]:
+        results = list()
+        for scale in [1, 10, 100, 1000]:
+            seed(arguments.seed)
+            rules = mechanics.Rules(
+                rows=3 * scale if rowScale else 3, handSize=10 * scale,
+                basicUnits=16 * scale, firstUnique=6 * scale,
+                secondUnique=3 * scale
+            )
+            perTurn, setup = measureTurns(rules, arguments.turns)
+            results.append(perTurn)
+            print("{:>8}{:>8}{:>10}{:>14.2f}{:>12.2f}".format(
+                rules.rows, rules.handSize, rules.deckSize, perTurn * 1e6,
+                setup * 1e3
+            ))
+        print("rules grew 1000x, per-turn cost grew {:.2f}x".format(
+            results[-1] / results[0]
+        ))
+
+
+class CountingPolicy(simulation.RandomPolicy):
+    def __init__(self):
+        super().__init__()
+        self.turns = 0
+
+    def makeTurn(self, player, opponent, opponentPassed=False):
+        self.turns += 1
+        return super().makeTurn(player, opponent, opponentPassed)
+
+
+def runVector(arguments):
+    import numpy as np
+    import vecenv
+
+    seed(arguments.seed)
+    policy = CountingPolicy()
+    start = time.perf_counter()
+    while policy.turns < arguments.turns * 10:
+        opponent = mechanics.AI("Benchmark AI", 1)
+        simulation.createMatch(policy, opponent).play()
+    loopRate = policy.turns / (time.perf_counter() - start)
+
+    env = vecenv.VectorEnv(arguments.games, difficulty=1,
+                           seed=arguments.seed)
+    env.reset()
+    random = np.random.default_rng(arguments.seed)
+    steps = max(1, arguments.turns // 10)
+    start = time.perf_counter()
+    for i in range(steps):
+        hand = env.getActionMask()
+        keys = random.random(hand.shape)
+        keys[~hand] = -1
+        passing = random.random(env.count) < 0.1
+        env.step(np.where(hand.any(axis=1) & ~passing, keys.argmax(axis=1),
+                          -1))
+    vectorRate = steps * env.count / (time.perf_counter() - start)
+
+    print("object loop: {:.0f} steps/s".format(loopRate))
+    print("vector env with {} games: {:.0f} steps/s".format(
+        env.count, vectorRate
+    ))
+    print("speedup {:.1f}x".format(vectorRate / loopRate))
+
+
+def measureMatches(arguments, repeats=5):
+    best = None
+    for i in range(repeats):
+        seed(arguments.seed)
+        start = time.perf_counter()
+        profiling.runMatches(max(1, arguments.turns // 20))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def runProfiling(arguments):
+    profiler = profiling.Profiler()
+    originals = [owner.__dict__[name] for owner, name in profiler.targets]
+    baseline = measureMatches(arguments)
+    with profiler:
+        enabled = measureMatches(arguments)
+    disabled = measureMatches(arguments)
+    print("{:<12}{:>12}{:>12}".format("profiler", "ms", "overhead"))
+    for name, elapsed in [("never on", baseline), ("enabled", enabled),
+                          ("disabled", disabled)]:
+        print("{:<12}{:>12.2f}{:>11.1f}%".format(
+            name, elapsed * 1e3, (elapsed / baseline - 1) * 100
+        ))
+    restored = all(owner.__dict__[name] is original
+                   for (owner, name), original in zip(profiler.targets,
+                                                      originals))
+    print("original methods restored: {}".format(restored))
+
+
+def printLoad(name, stats, elapsed):
+    requests = sum(len(samples) for samples in stats.samples.values())
+    print("{:<16}{:>10.1f}{:>12.2f}{:>10}".format(
+        name, requests / elapsed, stats.games / elapsed,
+        sum(stats.errors.values())
+    ))
+
+
+def getBotActions(states):
+    actions = list()
+    for gameId, state in states.items():
+        if state["state"] == 2:
+            hand = state["hand"]
+            actions.append([gameId, "play", hand[0][0]] if len(hand) > 0
+                           else [gameId, "pass"])
+        elif state["state"] == 3:
+            actions.append([gameId, "dismissPass"])
+        elif state["state"] == 5:
+            actions.append([gameId, "continue"])
+    return actions
+
+
+def runApi(arguments):
+    import loadtest
+    import web
+
+    stats, elapsed = loadtest.runLoad(16, 2, seed=arguments.seed)
+    print("form routes: {:.1f} games/s".format(stats.games / elapsed))
+
+    client = web.gwentWeb.test_client()
+    start = time.perf_counter()
+    count = min(arguments.games, web.maxBatch)
+    states = dict(client.post("/api/batch", json={
+        "create": {"difficulty": 1, "count": count}
+    }).get_json()["created"])
+    calls = 1
+    moves = 0
+    actions = getBotActions(states)
+    while len(actions) > 0 and calls < 1000:
+        response = client.post("/api/batch", json={"actions": actions})
+        states.update(response.get_json()["results"])
+        calls += 1
+        moves += len(actions)
+        actions = getBotActions(states)
+    elapsed = time.perf_counter() - start
+    print("batch API: {} games, {} moves in {} calls, {:.1f} games/s, "
+          "{:.0f} moves/s".format(count, moves, calls, count / elapsed,
+                                  moves / elapsed))
+
+
+def runSharding(arguments):
+    import loadtest
+    import sharding
+
+    games = max(1, arguments.turns // 1000)
+    print("{:<16}{:>10}{:>12}{:>10}".format("hosting", "req/s", "games/s",
+                                            "errors"))
+    printLoad("one process", *loadtest.runLoad(16, games,
+                                               seed=arguments.seed))
+    shards = 1
+    while shards <= max(2, os.cpu_count()):
+        router = sharding.Router(shards)
+        try:
+            printLoad("{} shards".format(shards), *loadtest.runLoad(
+                16 * shards, games, seed=arguments.seed, app=router
+            ))
+        finally:
+            router.close()
+        shards *= 2
+    print("{} cores available".format(os.cpu_count()))
+
+
+benchmarks = {
+    "api": runApi,
+    "profiling": runProfiling,
+    "scaling": runScaling,
+    "sharding": runSharding,
+    "vector": runVector
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Engine benchmarks.")
+    parser.add_argument("benchmark", choices=sorted(benchmarks))
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--games", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    benchmarks[arguments.benchmark](arguments)
@@ -0,0 +1,171 @@
+import argparse
+import json
+from itertools import product
+from math import sqrt
+from multiprocessing import Pool
+import mechanics
+import simulation
+import streams
+
+
+def getWilsonInterval(wins, games, z):
+    if games == 0:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    center = (rate + z * z / (2 * games)) / denominator
+    spread = z * sqrt(rate * (1 - rate) / games +
+                      z * z / (4 * games * games)) / denominator
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+class Candidate:
+    def __init__(self, index, strengthThreshold, passRate, buffLimit,
+                 cheating):
+        self.index = index
+        self.strengthThreshold = strengthThreshold
+        self.passRate = passRate
+        self.buffLimit = buffLimit
+        self.cheating = cheating
+        self.wins = 0
+        self.games = 0
+
+    def getParams(self):
+        return (self.strengthThreshold, self.passRate, self.buffLimit,
+                self.cheating)
+
+    def getRate(self):
+        return self.wins / self.games if self.games > 0 else 0.0
+
+    def describe(self):
+        return {
+            "strengthThreshold": self.strengthThreshold,
+            "passRate": self.passRate,
+            "buffLimit": self.buffLimit,
+            "cheating": self.cheating,
+            "winRate": round(self.getRate(), 4),
+            "games": self.games
+        }
+
+
+def createOpponent(params, rng=None):
+    strengthThreshold, passRate, buffLimit, cheating = params
+    playerAI = mechanics.AI("Calibrated AI", rng=rng)
+    playerAI.strengthThreshold = strengthThreshold
+    playerAI.passRate = passRate
+    playerAI.buffLimit = buffLimit
+    if cheating:
+        return mechanics.getCheatingAI(playerAI)
+    return playerAI
+
+
+def playBatch(task):
+    masterSeed, candidateIndex, params, firstGame, games = task
+    wins = 0
+    policy = simulation.ReferencePolicy()
+    for game in range(firstGame, firstGame + games):
+        # every game owns its streams, so results do not depend on workers
+        stream = streams.getStream(masterSeed, candidateIndex, game)
+        opponent = createOpponent(params, stream.split("opponent"))
+        match = simulation.createMatch(policy, opponent, game % 2,
+                                       rng=stream.split("player"))
+        if match.play() == 1:
+            wins += 1
+    return wins
+
+
+class Calibrator:
+    def __init__(self, targets=None, workers=None, batchSize=40,
+                 maxGames=2000, tolerance=0.03, z=1.96, masterSeed=0):
+        self.targets = targets if targets is not None else \
+            Calibrator.defaultTargets
+        self.workers = workers
+        self.batchSize = batchSize
+        self.maxGames = maxGames
+        self.tolerance = tolerance
+        self.z = z
+        self.masterSeed = masterSeed
+
+    def createCandidates(self):
+        space = product(*Calibrator.searchSpace)
+        return [Candidate(i, *params) for i, params in enumerate(space)]
+
+    def isUseful(self, candidate, tiers):
+        low, high = getWilsonInterval(candidate.wins, candidate.games,
+                                      self.z)
+        return any(low <= self.targets[tier] <= high for tier in tiers)
+
+    def isResolved(self, candidate, tier):
+        low, high = getWilsonInterval(candidate.wins, candidate.games,
+                                      self.z)
+        return (low <= self.targets[tier] <= high and
+                (high - low) / 2 <= self.tolerance)
+
+    def run(self):
+        candidates = self.createCandidates()
+        evaluated = list(candidates)
+        unresolved = set(range(len(self.targets)))
+        results = dict()
+        with Pool(self.workers) as pool:
+            while len(unresolved) > 0 and len(candidates) > 0:
+                tasks = [(self.masterSeed, candidate.index,
+                          candidate.getParams(), candidate.games,
+                          self.batchSize) for candidate in candidates]
+                wins = pool.map(playBatch, tasks)
+                for candidate, candidateWins in zip(candidates, wins):
+                    candidate.wins += candidateWins
+                    candidate.games += self.batchSize
+
+                for tier in sorted(unresolved):
+                    resolved = [candidate for candidate in candidates
+                                if self.isResolved(candidate, tier)]
+                    if len(resolved) > 0:
+                        results[tier] = min(resolved, key=lambda c: abs(
+                            c.getRate() - self.targets[tier]))
+                        unresolved.remove(tier)
+
+                # drop candidates which cannot hit any remaining target
+                candidates = [candidate for candidate in candidates
+                              if candidate.games < self.maxGames and
+                              self.isUseful(candidate, unresolved)]
+
+        for tier in unresolved:
+            results[tier] = min(evaluated, key=lambda c: abs(
+                c.getRate() - self.targets[tier]))
+        return results
+
+    defaultTargets = [0.7, 0.5, 0.3, 0.1]
+    searchSpace = [
+        [5, 10, 15, 20, 25],
+        [2, 3, 5, 8],
+        [0, 1, 2, 3, 4, 5],
+        [False, True]
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Calibrate AI difficulty tiers by simulated games."
+    )
+    parser.add_argument("--targets", type=float, nargs="+",
+                        default=Calibrator.defaultTargets)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch", type=int, default=40)
+    parser.add_argument("--max-games", type=int, default=2000)
+    parser.add_argument("--tolerance", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    arguments = parser.parse_args()
+
+    calibrator = Calibrator(arguments.targets, arguments.workers,
+                            arguments.batch, arguments.max_games,
+                            arguments.tolerance, masterSeed=arguments.seed)
+    results = calibrator.run()
+    report = dict()
+    for tier in sorted(results):
+        report[tier] = results[tier].describe()
+        report[tier]["target"] = calibrator.targets[tier]
+        print("tier {}: {}".format(tier, report[tier]))
+    if arguments.output is not None:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=4)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import string
+
+
+def renumber(line, first=0):
+    # auto fields become explicit, so compiled templates can be joined
+    parts = list()
+    index = first
+    for literal, field, spec, conversion in string.Formatter().parse(line):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if field == "":
+            field = str(index)
+            index += 1
+        else:
+            field = str(int(field) + first)
+        if conversion:
+            field += "!" + conversion
+        if spec:
+            field += ":" + spec
+        parts.append("{" + field + "}")
+    return "".join(parts)
+
+
+def compileCatalog(lines):
+    iterator = iter(lines)
+
+    def take(count):
+        return [next(iterator) for i in range(count)]
+
+    playerNames = take(2)
+    difficultyOptions = take(4)
+    fractionOptions = take(2)
+    playerLabel = take(3)
+    rowTypes = take(3)
+    roundEnded, gameEnded = take(2)
+    endingMessage = take(4)
+    endingActions = take(3)
+    commander, spy = take(2)
+
+    labelLines = [renumber(playerLabel[0]), renumber(playerLabel[1], 3)]
+    # the action is the fifth argument of both result lines
+    messageLines = [renumber(endingMessage[0]),
+                    renumber(endingMessage[1], 2),
+                    renumber(endingMessage[2], 4),
+                    renumber(endingMessage[3])]
+    return {
+        "playerNames": playerNames,
+        "difficultyOptions": difficultyOptions,
+        "fractionOptions": fractionOptions,
+        "rowTypes": rowTypes,
+        "roundEnded": roundEnded,
+        "gameEnded": gameEnded,
+        "endingActions": endingActions,
+        "playerLabel": "<br>".join(labelLines),
+        "aiLabel": "<br>".join(labelLines + [renumber(playerLabel[2], 5)]),
+        "roundMessage": "".join(line + "<br>" for line in
+                                messageLines[:2] + messageLines[3:]),
+        "gameMessage": "".join(line + "<br>" for line in messageLines),
+        "unitButtons": [rowType + " " for rowType in rowTypes],
+        "commanderButtons": [commander + " " + rowType + " "
+                             for rowType in rowTypes],
+        "spyButtons": [spy + " " + rowType + " " for rowType in rowTypes]
+    }
+
+
+class Catalog:
+    def __init__(self, locale, data):
+        self.locale = locale
+        self.playerNames = data["playerNames"]
+        self.difficultyOptions = data["difficultyOptions"]
+        self.fractionOptions = data["fractionOptions"]
+        self.rowTypes = data["rowTypes"]
+        self.roundEnded = data["roundEnded"]
+        self.gameEnded = data["gameEnded"]
+        self.endingActions = data["endingActions"]
+        self.playerLabel = data["playerLabel"]
+        self.aiLabel = data["aiLabel"]
+        self.roundMessage = data["roundMessage"]
+        self.gameMessage = data["gameMessage"]
+        self.unitButtons = data["unitButtons"]
+        self.commanderButtons = data["commanderButtons"]
+        self.spyButtons = data["spyButtons"]
+
+    def __reduce__(self):
+        # games moved between processes use the catalog loaded there
+        return getCatalog, (self.locale,)
+
+
+def loadCatalog(locale, sourcePath, buildDirectory):
+    with open(sourcePath, "rb") as source:
+        text = source.read()
+    digest = hashlib.blake2b(text, digest_size=16).hexdigest()
+    artifactPath = os.path.join(buildDirectory,
+                                "texts.{}.json".format(locale))
+    try:
+        with open(artifactPath, "r", encoding="utf-8") as artifact:
+            compiled = json.load(artifact)
+        if compiled.get("source") == digest and \
+                compiled.get("format") == artifactFormat:
+            return Catalog(locale, compiled["catalog"])
+    except (OSError, ValueError):
+        pass
+
+    data = compileCatalog(text.decode("utf-8").splitlines())
+    temporaryPath = "{}.{}.tmp".format(artifactPath, os.getpid())
+    try:
+        os.makedirs(buildDirectory, exist_ok=True)
+        with open(temporaryPath, "w", encoding="utf-8") as artifact:
+            json.dump({"source": digest, "format": artifactFormat,
+                       "catalog": data}, artifact, ensure_ascii=False)
+        os.replace(temporaryPath, artifactPath)
+    except OSError:
+        # a read-only tree still serves the catalog compiled in memory
+        try:
+            os.remove(temporaryPath)
+        except OSError:
+            pass
+    return Catalog(locale, data)
+
+
+def loadCatalogs(sourceDirectory, buildDirectory):
+    for name in sorted(os.listdir(sourceDirectory)):
+        match = sourcePattern.match(name)
+        if match:
+            locale = match.group(1) or defaultLocale
+            catalogs[locale] = loadCatalog(
+                locale, os.path.join(sourceDirectory, name), buildDirectory
+            )
+    return catalogs
+
+
+def getCatalog(locale):
+    return catalogs.get(locale, catalogs[defaultLocale])
+
+
+artifactFormat = 1
+defaultLocale = "en"
+sourcePattern = re.compile(r"texts(?:\.([A-Za-z_-]+))?\.txt$")
+catalogs = dict()
@@ -0,0 +1,292 @@
+import argparse
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+import mechanics
+
+
+class RecordType:
+    turn = 0
+    round = 1
+
+
+class CardKind:
+    none = 0
+    unit = 1
+    commander = 2
+    spy = 3
+
+
+def getCardKind(unit):
+    if isinstance(unit, mechanics.Commander):
+        return CardKind.commander
+    elif isinstance(unit, mechanics.Spy):
+        return CardKind.spy
+    return CardKind.unit
+
+
+def getGameNumber(gameId):
+    if isinstance(gameId, int):
+        return gameId & 0xFFFFFFFFFFFFFFFF
+    digest = hashlib.blake2b(str(gameId).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def getPadding(size):
+    return -size % 8
+
+
+class ColumnarLogWriter:
+    def __init__(self, directory, prefix="games", batchRows=4096,
+                 rowsPerFile=1 << 20):
+        self.directory = directory
+        self.prefix = prefix
+        self.batchRows = batchRows
+        self.rowsPerFile = rowsPerFile
+        self.lock = threading.Lock()
+        self.columns = [array(typecode) for name, typecode in schema]
+        self.rows = 0
+        self.fileRows = 0
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+        self.fileIndex = self.findNextIndex()
+        with writersLock:
+            writers.setdefault(os.path.abspath(directory), self)
+
+    def __reduce__(self):
+        # recorders moved to another process log through its own writer
+        return getWriter, (self.directory,)
+
+    def findNextIndex(self):
+        pattern = re.compile(re.escape(self.prefix) + r"-(\d+)\.gwlog$")
+        indices = [int(match.group(1)) for match in
+                   map(pattern.match, os.listdir(self.directory)) if match]
+        return max(indices) + 1 if len(indices) > 0 else 0
+
+    def openFile(self):
+        path = os.path.join(self.directory, "{}-{:06d}.gwlog".format(
+            self.prefix, self.fileIndex))
+        self.fileIndex += 1
+        self.fileRows = 0
+        self.file = open(path, "wb")
+        self.file.write(getHeader())
+
+    def append(self, row):
+        with self.lock:
+            for column, value in zip(self.columns, row):
+                column.append(value)
+            self.rows += 1
+            if self.rows >= self.batchRows:
+                self.writeBlock()
+
+    def writeBlock(self):
+        if self.rows == 0:
+            return
+        if self.file is None:
+            self.openFile()
+        self.file.write(struct.pack("<II", self.rows, 0))
+        for column in self.columns:
+            data = column.tobytes()
+            self.file.write(data)
+            self.file.write(bytes(getPadding(len(data))))
+        self.file.flush()
+        self.fileRows += self.rows
+        self.rows = 0
+        self.columns = [array(typecode) for name, typecode in schema]
+        if self.fileRows >= self.rowsPerFile:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        with self.lock:
+            self.writeBlock()
+
+    def close(self):
+        with self.lock:
+            self.writeBlock()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def getWriter(directory):
+    with writersLock:
+        writer = writers.get(os.path.abspath(directory))
+    if writer is None:
+        writer = ColumnarLogWriter(directory)
+    return writer
+
+
+class ColumnarLogReader:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.columns = readHeader(self.view)
+        self.blocks = list()
+        self.rows = 0
+
+        # only block headers are visited, column data stays untouched
+        offset = len(getHeader())
+        size = len(self.view)
+        while offset + 8 <= size:
+            rowCount = struct.unpack_from("<I", self.view, offset)[0]
+            offset += 8
+            offsets = list()
+            for name, typecode in self.columns:
+                offsets.append(offset)
+                length = rowCount * array(typecode).itemsize
+                offset += length + getPadding(length)
+            if offset > size:
+                break
+            self.blocks.append((rowCount, offsets))
+            self.rows += rowCount
+
+    def __len__(self):
+        return self.rows
+
+    def getColumn(self, name):
+        index = [column[0] for column in self.columns].index(name)
+        typecode = self.columns[index][1]
+        itemSize = array(typecode).itemsize
+        for rowCount, offsets in self.blocks:
+            start = offsets[index]
+            yield self.view[start:start + rowCount * itemSize].cast(typecode)
+
+    def close(self):
+        # column views handed out earlier must be released before this call
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+class GameRecorder:
+    def __init__(self, writer, gameId, player1, player2, events,
+                 difficulty=0, fraction=0):
+        self.writer = writer
+        self.gameNumber = getGameNumber(gameId)
+        self.player1 = player1
+        self.player2 = player2
+        self.difficulty = difficulty
+        self.fraction = fraction
+        self.turn = 0
+        self.round = 0
+        self.passed = [0, 0]
+        events.subscribe(mechanics.EventType.cardPlayed, self.onCardPlayed)
+        events.subscribe(mechanics.EventType.turnPassed, self.onTurnPassed)
+        events.subscribe(mechanics.EventType.roundEnded, self.onRoundEnded)
+
+    def getActor(self, player):
+        return 0 if player is self.player1 else 1
+
+    def record(self, recordType, actor, cardKind, rowType, strength, rowSum,
+               outcome):
+        self.writer.append((
+            self.gameNumber, self.turn, self.round, recordType, actor,
+            self.fraction, self.difficulty, cardKind, rowType, strength,
+            rowSum, self.player1.getSum(), self.player2.getSum(),
+            self.passed[0], self.passed[1], outcome
+        ))
+
+    def onCardPlayed(self, player, unit):
+        self.record(RecordType.turn, self.getActor(player), getCardKind(unit),
+                    unit.rowType, unit.strength,
+                    player.rows[unit.rowType].sum, 0)
+        self.turn += 1
+
+    def onTurnPassed(self, player, subject):
+        actor = self.getActor(player)
+        self.passed[actor] = 1
+        self.record(RecordType.turn, actor, CardKind.none, -1, 0, 0, 0)
+        self.turn += 1
+
+    def onRoundEnded(self, player, subject):
+        sum1 = self.player1.getSum()
+        sum2 = self.player2.getSum()
+        outcome = (sum1 > sum2) - (sum1 < sum2)
+        self.record(RecordType.round, 0, CardKind.none, -1, 0, 0, outcome)
+        self.round += 1
+        self.passed = [0, 0]
+
+
+def getHeader():
+    header = bytearray(magic)
+    header += struct.pack("<I", len(schema))
+    for name, typecode in schema:
+        header += name.encode().ljust(15, b"\0") + typecode.encode()
+    header += bytes(getPadding(len(header)))
+    return bytes(header)
+
+
+def readHeader(view):
+    if bytes(view[:len(magic)]) != magic:
+        raise ValueError("not a game log file")
+    count = struct.unpack_from("<I", view, len(magic))[0]
+    columns = list()
+    offset = len(magic) + 4
+    for i in range(count):
+        entry = bytes(view[offset:offset + 16])
+        columns.append((entry[:15].rstrip(b"\0").decode(),
+                        chr(entry[15])))
+        offset += 16
+    if columns != schema:
+        raise ValueError("unsupported game log schema")
+    return columns
+
+
+magic = b"GWLOG01\0"
+writers = dict()
+writersLock = threading.Lock()
+schema = [
+    ("gameId", "Q"),
+    ("turn", "H"),
+    ("round", "B"),
+    ("recordType", "B"),
+    ("actor", "B"),
+    ("fraction", "B"),
+    ("difficulty", "B"),
+    ("cardKind", "B"),
+    ("rowType", "h"),
+    ("strength", "h"),
+    ("rowSum", "i"),
+    ("sum1", "i"),
+    ("sum2", "i"),
+    ("passed1", "B"),
+    ("passed2", "B"),
+    ("outcome", "b")
+]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize game logs.")
+    parser.add_argument("paths", nargs="+")
+    arguments = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = 0
+    spies = 0
+    rounds = 0
+    roundsWon = 0
+    for path in arguments.paths:
+        reader = ColumnarLogReader(path)
+        rows += len(reader)
+        for kinds in reader.getColumn("cardKind"):
+            spies += kinds.tobytes().count(CardKind.spy)
+            kinds.release()
+        for types, outcomes in zip(reader.getColumn("recordType"),
+                                   reader.getColumn("outcome")):
+            rounds += types.tobytes().count(RecordType.round)
+            roundsWon += outcomes.tobytes().count(1)
+            types.release()
+            outcomes.release()
+        reader.close()
+    elapsed = time.perf_counter() - start
+    print("{} rows scanned in {:.3f}s ({:.1f}M rows/s)".format(
+        rows, elapsed, rows / max(elapsed, 1e-9) / 1e6))
+    print("{} spies played, {} of {} rounds won by the player".format(
+        spies, roundsWon, rounds))
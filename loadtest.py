@@ -0,0 +1,205 @@
+import argparse
+import http.cookiejar
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+import werkzeug.test
+
+
+class TestClientTransport:
+    def __init__(self, app=None):
+        if app is None:
+            # the application reads its texts relative to the project root
+            import web
+            app = web.gwentWeb
+        self.client = werkzeug.test.Client(app)
+
+    def request(self, method, route, form=None):
+        if method == "GET":
+            response = self.client.get(route)
+        else:
+            response = self.client.post(route, data=form)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args):
+        return None
+
+
+class HttpTransport:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirectHandler()
+        )
+
+    def request(self, method, route, form=None):
+        data = None
+        if method == "POST":
+            data = urllib.parse.urlencode(form or dict()).encode()
+        try:
+            with self.opener.open(self.url + route, data) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read().decode()
+
+
+def getPercentile(samples, percent):
+    if len(samples) == 0:
+        return 0.0
+    rank = max(0, int(len(samples) * percent / 100 + 0.5) - 1)
+    return samples[min(rank, len(samples) - 1)]
+
+
+class LatencyStats:
+    def __init__(self):
+        self.samples = dict()
+        self.errors = dict()
+        self.games = 0
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, failed):
+        with self.lock:
+            self.samples.setdefault(route, list()).append(seconds)
+            if failed:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def finishGame(self):
+        with self.lock:
+            self.games += 1
+
+    def getReport(self, elapsed):
+        total = sum(len(samples) for samples in self.samples.values())
+        lines = [
+            "{} requests, {} games in {:.2f}s: {:.1f} req/s, "
+            "{:.2f} games/s".format(total, self.games, elapsed,
+                                    total / elapsed, self.games / elapsed),
+            "{:<20}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+                "route", "count", "errors", "req/s", "p50 ms", "p95 ms",
+                "p99 ms"
+            )
+        ]
+        for route in sorted(self.samples):
+            samples = sorted(self.samples[route])
+            lines.append("{:<20}{:>8}{:>8}{:>10.1f}{:>10.2f}{:>10.2f}"
+                         "{:>10.2f}".format(
+                             route, len(samples), self.errors.get(route, 0),
+                             len(samples) / elapsed,
+                             getPercentile(samples, 50) * 1000,
+                             getPercentile(samples, 95) * 1000,
+                             getPercentile(samples, 99) * 1000
+                         ))
+        return "\n".join(lines)
+
+
+class VirtualPlayer:
+    def __init__(self, transport, stats, thinkTime=0.0, passChance=0.1,
+                 seed=None):
+        self.transport = transport
+        self.stats = stats
+        self.thinkTime = thinkTime
+        self.passChance = passChance
+        self.random = Random(seed)
+
+    def call(self, method, route, form=None):
+        start = time.perf_counter()
+        status, page = self.transport.request(method, route, form)
+        self.stats.record("{} {}".format(method, route),
+                          time.perf_counter() - start, status >= 400)
+        return page
+
+    def step(self, route, form):
+        self.call("POST", route, form)
+        return self.call("GET", "/")
+
+    def think(self):
+        if self.thinkTime > 0:
+            time.sleep(self.random.uniform(0, 2 * self.thinkTime))
+
+    def playGame(self):
+        page = self.call("GET", "/")
+        if 'action="/difficulty"' not in page:
+            page = self.step("/restart", {"restart": ""})
+        self.think()
+        difficulty = self.random.choice(VirtualPlayer.difficulties)
+        page = self.step("/difficulty", {difficulty: ""})
+        self.think()
+        fraction = self.random.choice(VirtualPlayer.fractions)
+        page = self.step("/fraction", {fraction: ""})
+
+        for i in range(VirtualPlayer.maxSteps):
+            self.think()
+            if 'action="/play"' in page:
+                units = VirtualPlayer.unitPattern.findall(page)
+                if len(units) > 0 and self.random.random() > self.passChance:
+                    page = self.step("/play",
+                                     {"unit": self.random.choice(units)})
+                else:
+                    page = self.step("/pass", {"pass": ""})
+            elif 'action="/dismissPass"' in page:
+                page = self.step("/dismissPass", {"ok": ""})
+            elif 'action="/continue"' in page and \
+                    'action="/restart"' in page:
+                page = self.step("/continue", {"ok": ""})
+            else:
+                break
+        self.stats.finishGame()
+
+    def run(self, games):
+        for i in range(games):
+            self.playGame()
+
+    difficulties = ["easy", "medium", "hard", "cheater"]
+    fractions = ["north", "nilfgaard"]
+    unitPattern = re.compile(r'name="unit" value="(\d+)"')
+    maxSteps = 500
+
+
+def runLoad(players, games, url=None, thinkTime=0.0, passChance=0.1,
+            seed=0, app=None):
+    stats = LatencyStats()
+    virtualPlayers = list()
+    for i in range(players):
+        if url is None:
+            transport = TestClientTransport(app)
+        else:
+            transport = HttpTransport(url)
+        virtualPlayers.append(VirtualPlayer(transport, stats, thinkTime,
+                                            passChance, seed * players + i))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(players) as executor:
+        futures = [executor.submit(virtualPlayer.run, games)
+                   for virtualPlayer in virtualPlayers]
+        for future in futures:
+            future.result()
+    return stats, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent players against the web app."
+    )
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--games", type=int, default=5,
+                        help="games played by every virtual player")
+    parser.add_argument("--url", default=None,
+                        help="server address, in-process test client if "
+                             "omitted")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="mean think time between actions in seconds")
+    parser.add_argument("--pass-chance", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    stats, elapsed = runLoad(arguments.players, arguments.games,
+                             arguments.url, arguments.think,
+                             arguments.pass_chance, arguments.seed)
+    print(stats.getReport(elapsed))
@@ -1,9 +1,10 @@
 from abc import abstractmethod
 from copy import copy
-from random import randint, choice, shuffle
+import streams
 
 rows = 3
 roundWinCondition = 2
+missingStrength = float("-inf")
 
 
 class RowType:
@@ -18,28 +19,105 @@ class ConditionType:
     inGame = 2
     dead = 3
 
+    count = 4
+
 
 class Fraction:
     north = 0
     nilfgaard = 1
 
 
+class EventType:
+    cardDrawn = 0
+    cardPlayed = 1
+    rowBuffed = 2
+    rowsCleared = 3
+    roundWon = 4
+    turnPassed = 5
+    roundEnded = 6
+
+    count = 7
+
+
+class EventBus:
+    def __init__(self):
+        self.handlers = [list() for i in range(EventType.count)]
+
+    def subscribe(self, eventType, handler):
+        self.handlers[eventType].append(handler)
+
+    def unsubscribe(self, eventType, handler):
+        self.handlers[eventType].remove(handler)
+
+    def emit(self, eventType, player, subject=None):
+        # an event nobody listens to costs a single list lookup
+        handlers = self.handlers[eventType]
+        if handlers:
+            for handler in handlers:
+                handler(player, subject)
+
+
+class Rules:
+    def __init__(self, rows=3, roundWinCondition=2, handSize=10,
+                 basicUnits=16, firstUnique=6, secondUnique=3):
+        self.rows = rows
+        self.roundWinCondition = roundWinCondition
+        self.handSize = handSize
+        self.basicUnits = basicUnits
+        self.firstUnique = firstUnique
+        self.secondUnique = secondUnique
+        self.deckSize = basicUnits + firstUnique + secondUnique
+
+
 class Unit:
     def __init__(self, rowType, strength):
         self.player = None
         self.rowType = rowType
-        self.strength = strength
-        self.condition = ConditionType.inDeck
+        self.baseStrength = strength
+        self.currentCondition = ConditionType.inDeck
+
+    @property
+    def condition(self):
+        return self.currentCondition
+
+    @condition.setter
+    def condition(self, condition):
+        if self.player is not None:
+            self.player.moveUnit(self, self.currentCondition, condition)
+        self.currentCondition = condition
+
+    # commanders' bonuses are applied lazily, so playing one is O(1)
+    @property
+    def strength(self):
+        if self.currentCondition == ConditionType.inGame:
+            return self.baseStrength + self.getBonus()
+        return self.baseStrength
+
+    @strength.setter
+    def strength(self, strength):
+        delta = strength - self.strength
+        self.baseStrength += delta
+        if self.currentCondition == ConditionType.inGame:
+            self.player.rows[self.rowType].addStrength(delta)
+        elif self.currentCondition == ConditionType.inHand and \
+                self.player is not None:
+            self.player.hand.update(self)
+
+    def getBonus(self):
+        return self.player.rows[self.rowType].activeCommanders
+
+    def getPlayGain(self):
+        return self.baseStrength + self.getBonus()
 
     def setPlayer(self, player):
         self.player = player
+        player.addUnit(self)
 
     def play(self):
         row = self.player.rows[self.rowType]
         self.condition = ConditionType.inGame
-        self.strength += row.activeCommanders
-        row.units.append(self)
-        row.updateSum()
+        row.addUnit(self)
+        self.player.events.emit(EventType.cardPlayed, self.player, self)
 
     def acceptLabeler(self, labeler):
         return labeler.getUnitLabel(self)
@@ -51,15 +129,20 @@ class Commander(Unit):
     def __init__(self, rowType, strength):
         super().__init__(rowType, strength)
 
+    def getBonus(self):
+        return self.player.rows[self.rowType].activeCommanders - 1
+
+    def getPlayGain(self):
+        row = self.player.rows[self.rowType]
+        return self.baseStrength + row.activeCommanders + len(row.units)
+
     def play(self):
         row = self.player.rows[self.rowType]
         self.condition = ConditionType.inGame
-        self.strength += row.activeCommanders
-        for unit in row.units:
-            unit.strength += 1
-        row.units.append(self)
         row.activeCommanders += 1
-        row.updateSum()
+        row.addUnit(self)
+        self.player.events.emit(EventType.rowBuffed, self.player, row)
+        self.player.events.emit(EventType.cardPlayed, self.player, self)
 
     def acceptLabeler(self, labeler):
         return labeler.getCommanderLabel(self)
@@ -72,95 +155,205 @@ class Spy(Unit):
     def play(self):
         row = self.player.rows[self.rowType]
         self.condition = ConditionType.inGame
-        self.strength += row.activeCommanders
-        row.units.append(self)
+        row.addUnit(self)
         for i in range(2):
             self.player.drawCard()
-        row.updateSum()
+        self.player.events.emit(EventType.cardPlayed, self.player, self)
 
     def acceptLabeler(self, labeler):
         return labeler.getSpyLabel(self)
 
 
 class Creator:
+    def __init__(self, rules=None, rng=None):
+        self.rules = rules if rules is not None else defaultRules
+        self.rng = rng if rng is not None else streams.globalRandom
+
     @abstractmethod
     def create(self):
         pass
 
-    @staticmethod
     @abstractmethod
-    def generateStrength():
+    def generateStrength(self):
         pass
 
-    @staticmethod
-    def generateRowType():
-        return randint(0, rows - 1)
+    def generateRowType(self):
+        return self.rng.randint(0, self.rules.rows - 1)
 
 
 class UnitCreator(Creator):
-    def __init__(self):
-        pass
-
     def create(self):
-        rowType = UnitCreator.generateRowType()
-        strength = UnitCreator.generateStrength()
+        rowType = self.generateRowType()
+        strength = self.generateStrength()
         return Unit(rowType, strength)
 
-    @staticmethod
-    @abstractmethod
-    def generateStrength():
-        strength = randint(1, 2) * randint(1, 3) + randint(1, 4)
+    def generateStrength(self):
+        rng = self.rng
+        strength = rng.randint(1, 2) * rng.randint(1, 3) + rng.randint(1, 4)
         return strength
 
 
 class CommanderCreator(Creator):
-    def __init__(self):
-        pass
-
     def create(self):
-        rowType = CommanderCreator.generateRowType()
-        strength = CommanderCreator.generateStrength()
+        rowType = self.generateRowType()
+        strength = self.generateStrength()
         return Commander(rowType, strength)
 
-    @staticmethod
-    @abstractmethod
-    def generateStrength():
-        strength = randint(1, 2) * randint(1, 2) + randint(1, 4)
+    def generateStrength(self):
+        rng = self.rng
+        strength = rng.randint(1, 2) * rng.randint(1, 2) + rng.randint(1, 4)
         return strength
 
 
 class SpyCreator(Creator):
-    def __init__(self):
-        pass
-
     def create(self):
-        rowType = SpyCreator.generateRowType()
-        strength = SpyCreator.generateStrength()
+        rowType = self.generateRowType()
+        strength = self.generateStrength()
         return Spy(rowType, strength)
 
-    @staticmethod
-    @abstractmethod
-    def generateStrength():
-        strength = randint(1, 2) * randint(1, 3)
+    def generateStrength(self):
+        strength = self.rng.randint(1, 2) * self.rng.randint(1, 3)
         return strength
 
 
 class Row:
-    def __init__(self, rowType):
+    def __init__(self, rowType, player):
         self.rowType = rowType
+        self.player = player
         self.units = list()
+        self.baseSum = 0
         self.sum = 0
         self.activeCommanders = 0
 
+    def addUnit(self, unit):
+        if len(self.units) == 0:
+            self.player.occupiedRows.append(self.rowType)
+        self.units.append(unit)
+        self.baseSum += unit.baseStrength
+        self.updateSum()
+
+    def addStrength(self, delta):
+        self.baseSum += delta
+        self.updateSum()
+
     def updateSum(self):
-        self.sum = 0
+        # every unit is buffed by each commander in the row except itself
+        newSum = self.baseSum + self.activeCommanders * (len(self.units) - 1)
+        self.player.sum += newSum - self.sum
+        self.sum = newSum
+
+    def clear(self):
         for unit in self.units:
-            self.sum += unit.strength
+            if unit.condition == ConditionType.inGame:
+                unit.condition = ConditionType.dead
+        self.units = list()
+        self.baseSum = 0
+        self.activeCommanders = 0
+        self.updateSum()
 
     def acceptLabeler(self, labeler):
         return labeler.getRowLabel(self)
 
 
+class RowHand:
+    # hand units of one row in drawing order, under a max tree of strengths
+    def __init__(self):
+        self.size = 1
+        self.tree = [missingStrength, missingStrength]
+        self.slots = dict()
+        self.units = list()
+        self.serials = list()
+
+    def add(self, unit, serial):
+        if len(self.units) == self.size:
+            self.grow()
+        slot = len(self.units)
+        self.slots[unit] = slot
+        self.units.append(unit)
+        self.serials.append(serial)
+        self.set(slot, unit.strength)
+
+    def grow(self):
+        # doubling keeps appends amortized O(log n)
+        leaves = self.tree[self.size:] + [missingStrength] * self.size
+        self.size *= 2
+        self.tree = [missingStrength] * self.size + leaves
+        for i in reversed(range(1, self.size)):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def remove(self, unit):
+        self.set(self.slots.pop(unit), missingStrength)
+
+    def update(self, unit):
+        self.set(self.slots[unit], unit.strength)
+
+    def set(self, slot, strength):
+        i = slot + self.size
+        self.tree[i] = strength
+        i //= 2
+        while i > 0:
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    def findFirst(self, strength):
+        if self.tree[1] < strength:
+            return None
+        i = 1
+        while i < self.size:
+            i *= 2
+            if self.tree[i] < strength:
+                i += 1
+        return self.serials[i - self.size], self.units[i - self.size]
+
+
+class Hand:
+    def __init__(self, rows):
+        self.rows = rows
+        self.units = list()
+        self.positions = dict()
+        # commanders are added at query time, so a row change costs nothing
+        self.rowHands = dict()
+        self.drawn = 0
+
+    def add(self, unit):
+        self.positions[unit] = len(self.units)
+        self.units.append(unit)
+        rowHand = self.rowHands.get(unit.rowType)
+        if rowHand is None:
+            rowHand = RowHand()
+            self.rowHands[unit.rowType] = rowHand
+        rowHand.add(unit, self.drawn)
+        self.drawn += 1
+
+    def remove(self, unit):
+        # swap with the last unit to remove in O(1)
+        position = self.positions.pop(unit)
+        last = self.units.pop()
+        if last is not unit:
+            self.units[position] = last
+            self.positions[last] = position
+        self.rowHands[unit.rowType].remove(unit)
+
+    def update(self, unit):
+        self.rowHands[unit.rowType].update(unit)
+
+    def findFirst(self, gain):
+        # units are drawn in deck order, so this is the first one in the deck
+        first = None
+        for rowType, rowHand in self.rowHands.items():
+            bonus = self.rows[rowType].activeCommanders
+            found = rowHand.findFirst(gain - bonus)
+            if found is not None and (first is None or found[0] < first[0]):
+                first = found
+        return first[1] if first is not None else None
+
+    def __len__(self):
+        return len(self.units)
+
+    def __iter__(self):
+        return iter(self.units)
+
+
 class Deck(list):
     def __init__(self, *args):
         super().__init__(*args)
@@ -173,34 +366,36 @@ class Deck(list):
 
 
 class DeckGenerator:
-    def __init__(self):
+    def __init__(self, rules=None, rng=None):
+        self.rules = rules if rules is not None else defaultRules
         self.deckPreset = Deck()
-        for i in range(DeckGenerator.basicUnits):
-            unitCreator = UnitCreator()
+        unitCreator = UnitCreator(self.rules, rng)
+        for i in range(self.rules.basicUnits):
             self.deckPreset.append(unitCreator.create())
 
     def generateDeck(self, player):
+        # the preset is shared, everything else comes from the player's stream
         newDeck = self.deckPreset.getCopy()
-        commanderCreator = CommanderCreator()
-        spyCreator = SpyCreator()
+        commanderCreator = CommanderCreator(self.rules, player.rng)
+        spyCreator = SpyCreator(self.rules, player.rng)
 
         if player.fraction == Fraction.north:
-            for i in range(DeckGenerator.firstUnique):
+            for i in range(self.rules.firstUnique):
                 newDeck.append(commanderCreator.create())
                 newDeck[-1].strength += 2
-            for i in range(DeckGenerator.secondUnique):
+            for i in range(self.rules.secondUnique):
                 newDeck.append(spyCreator.create())
         elif player.fraction == Fraction.nilfgaard:
-            for i in range(DeckGenerator.firstUnique):
+            for i in range(self.rules.firstUnique):
                 newDeck.append(spyCreator.create())
                 newDeck[-1].strength += 2
-            for i in range(DeckGenerator.secondUnique):
+            for i in range(self.rules.secondUnique):
                 newDeck.append(commanderCreator.create())
 
-        for i in range(Player.deckSize):
+        for i in range(self.rules.deckSize):
             newDeck[i].setPlayer(player)
-        shuffle(newDeck)
-        for i in range(Player.handSize):
+        player.rng.shuffle(newDeck)
+        for i in range(self.rules.handSize):
             newDeck[i].condition = ConditionType.inHand
         return newDeck
 
@@ -210,52 +405,74 @@ class DeckGenerator:
 
 
 class Player:
-    def __init__(self, name, fraction=Fraction.north):
+    def __init__(self, name, fraction=Fraction.north, rules=None, rng=None):
         self.name = name
         self.fraction = fraction
+        self.rules = rules if rules is not None else defaultRules
+        self.rng = rng if rng is not None else streams.globalRandom
         self.roundsWon = 0
         self.deck = list()
         self.deckTop = 0
-        self.rows = [Row(i) for i in range(rows)]
+        self.sum = 0
+        self.rows = [Row(i, self) for i in range(self.rules.rows)]
+        self.occupiedRows = list()
+        self.hand = Hand(self.rows)
+        self.unitCounts = [0 for i in range(ConditionType.count)]
+        self.events = EventBus()
+
+    def setEvents(self, events):
+        self.events = events
 
     def generateDeck(self, deckGenerator):
         self.innerGenerateDeck(deckGenerator)
 
     def innerGenerateDeck(self, deckGenerator):
+        self.hand = Hand(self.rows)
+        self.unitCounts = [0 for i in range(ConditionType.count)]
         self.deck = deckGenerator.generateDeck(self)
-        self.deckTop = Player.handSize
+        self.deckTop = self.rules.handSize
+
+    def addUnit(self, unit):
+        self.unitCounts[unit.condition] += 1
+        if unit.condition == ConditionType.inHand:
+            self.hand.add(unit)
+
+    def moveUnit(self, unit, oldCondition, newCondition):
+        if oldCondition == newCondition:
+            return
+        self.unitCounts[oldCondition] -= 1
+        self.unitCounts[newCondition] += 1
+        if oldCondition == ConditionType.inHand:
+            self.hand.remove(unit)
+        elif newCondition == ConditionType.inHand:
+            self.hand.add(unit)
 
     def countUnits(self):
-        inHand = 0
-        inDeck = 0
-        for unit in self.deck:
-            if unit.condition == ConditionType.inHand:
-                inHand += 1
-            elif unit.condition == ConditionType.inDeck:
-                inDeck += 1
-        return inHand, inDeck
+        return (self.unitCounts[ConditionType.inHand],
+                self.unitCounts[ConditionType.inDeck])
 
     def getSum(self):
-        result = 0
-        for i in range(rows):
-            result += self.rows[i].sum
-        return result
+        return self.sum
 
     def drawCard(self):
-        if self.deckTop < Player.deckSize:
-            self.deck[self.deckTop].condition = ConditionType.inHand
+        if self.deckTop < self.rules.deckSize:
+            unit = self.deck[self.deckTop]
+            unit.condition = ConditionType.inHand
             self.deckTop += 1
+            self.events.emit(EventType.cardDrawn, self, unit)
 
     def winRound(self):
         self.roundsWon += 1
+        self.events.emit(EventType.roundWon, self, self.roundsWon)
         return self.roundsWon
 
     def clearRows(self):
-        for i in range(rows):
-            for unit in self.rows[i].units:
-                if unit.condition == ConditionType.inGame:
-                    unit.condition = ConditionType.dead
-            self.rows[i] = Row(i)
+        # only rows which got units since the last clear are touched
+        clearedRows = self.occupiedRows
+        self.occupiedRows = list()
+        for i in clearedRows:
+            self.rows[i].clear()
+        self.events.emit(EventType.rowsCleared, self, clearedRows)
 
     def refresh(self, deckGenerator):
         self.clearRows()
@@ -271,48 +488,46 @@ class Player:
 
 
 class AI(Player):
-    def __init__(self, name, difficulty=0):
-        super().__init__(name)
+    def __init__(self, name, difficulty=0, rules=None, rng=None):
+        super().__init__(name, rules=rules, rng=rng)
         self.difficulty = difficulty
+        self.buffLimit = difficulty + 1
 
     def generateDeck(self, deckGenerator):
         self.innerGenerateDeck(deckGenerator)
         for unit in self.deck:
-            unit.strength += randint(0, self.difficulty + 1)
+            unit.strength += self.rng.randint(0, self.buffLimit)
 
     def getUnitOptions(self):
-        options = list()
-        for unit in self.deck:
-            if unit.condition == ConditionType.inHand:
-                options.append(unit)
-        return options
+        return list(self.hand)
 
     def makeTurn(self, opponent, opponentPassed=False):
+        return self.chooseTurn(opponent.getSum(), opponent.roundsWon,
+                               opponentPassed)
+
+    def chooseTurn(self, opponentSum, opponentRoundsWon,
+                   opponentPassed=False):
         mySum = self.getSum()
-        opponentSum = opponent.getSum()
 
         # if opponent passed, then try to finish him
         if opponentPassed:
             if mySum > opponentSum:
                 return 0
-            options = self.getUnitOptions()
-            for unit in options:
-                add = unit.strength + self.rows[unit.rowType].activeCommanders
-                if mySum + add > opponentSum:
-                    return unit
-            return 0
+            unit = self.hand.findFirst(opponentSum - mySum + 1)
+            return unit if unit is not None else 0
 
         # if the situation is not critical, then possibly pass
-        if mySum > opponentSum + AI.strengthThreshold:
+        if mySum > opponentSum + self.strengthThreshold:
             return 0
-        if max(self.roundsWon, opponent.roundsWon) < roundWinCondition - 1:
-            passTry = randint(0, AI.passRate)
-            if passTry == AI.passRate:
+        if max(self.roundsWon, opponentRoundsWon) < \
+                self.rules.roundWinCondition - 1:
+            passTry = self.rng.randint(0, self.passRate)
+            if passTry == self.passRate:
                 return 0
 
         # case is not that simple, so make a random turn :)
-        options = self.getUnitOptions()
-        return choice(options) if len(options) > 0 else 0
+        options = self.hand.units
+        return self.rng.choice(options) if len(options) > 0 else 0
 
     def acceptLabeler(self, labeler):
         return labeler.getAILabel(self)
@@ -338,7 +553,7 @@ class CardDrawingAI(CheatingAI):
         self.playerAI = playerAI
 
     def makeTurn(self, opponent, opponentPassed=False):
-        drawAmount = randint(0, 1)
+        drawAmount = self.playerAI.rng.randint(0, 1)
         for i in range(drawAmount):
             self.playerAI.drawCard()
         return self.playerAI.makeTurn(opponent, opponentPassed)
@@ -347,6 +562,9 @@ class CardDrawingAI(CheatingAI):
         self.playerAI.innerGenerateDeck(deckGenerator)
 
     def __getattr__(self, key):
+        # unpickling looks attributes up before playerAI is restored
+        if key == "playerAI":
+            raise AttributeError(key)
         return self.playerAI.__getattribute__(key)
 
 
@@ -355,21 +573,30 @@ class HandBuffingAI(CheatingAI):
         self.playerAI = playerAI
 
     def makeTurn(self, opponent, opponentPassed=False):
-        options = self.playerAI.getUnitOptions()
+        options = self.playerAI.hand.units
         if len(options) > 0:
-            choice(options).strength += randint(2, 3)
+            rng = self.playerAI.rng
+            rng.choice(options).strength += rng.randint(2, 3)
         return self.playerAI.makeTurn(opponent, opponentPassed)
 
     def generateDeck(self, deckGenerator):
         self.playerAI.innerGenerateDeck(deckGenerator)
 
     def __getattr__(self, key):
+        # unpickling looks attributes up before playerAI is restored
+        if key == "playerAI":
+            raise AttributeError(key)
         return self.playerAI.__getattribute__(key)
 
 
 def getCheatingAI(playerAI):
-    cheatType = randint(0, 1)
+    cheatType = playerAI.rng.randint(0, 1)
     if cheatType == 0:
         return CardDrawingAI(playerAI)
     elif cheatType == 1:
         return HandBuffingAI(playerAI)
+
+
+defaultRules = Rules(rows, roundWinCondition, Player.handSize,
+                     DeckGenerator.basicUnits, DeckGenerator.firstUnique,
+                     DeckGenerator.secondUnique)
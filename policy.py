@@ -0,0 +1,253 @@
+import argparse
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from multiprocessing import Pool
+import mechanics
+import simulation
+import streams
+
+
+def getBucket(unit):
+    if isinstance(unit, mechanics.Commander):
+        kind = 1
+    elif isinstance(unit, mechanics.Spy):
+        kind = 2
+    else:
+        kind = 0
+    strong = 1 if unit.strength > strongUnit else 0
+    return kind * 2 + strong
+
+
+def getStateKey(player, opponentSum, opponentRoundsWon, opponentPassed):
+    gap = (player.getSum() - opponentSum) // gapStep
+    gap = min(max(gap, -16), 15) + 16
+    key = gap
+    key = key * 3 + min(player.roundsWon, 2)
+    key = key * 3 + min(opponentRoundsWon, 2)
+    key = key * 2 + (1 if opponentPassed else 0)
+    counts = [0 for i in range(buckets)]
+    for unit in player.hand:
+        bucket = getBucket(unit)
+        counts[bucket] = min(counts[bucket] + 1, 3)
+    for count in counts:
+        key = key * 4 + count
+    return key
+
+
+def getActionUnit(player, action):
+    best = None
+    for unit in player.hand:
+        if getBucket(unit) == action - 1 and \
+                (best is None or unit.strength > best.strength):
+            best = unit
+    return best
+
+
+def getAction(unit):
+    return 0 if unit == 0 else getBucket(unit) + 1
+
+
+class PolicyTable:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(magic)] != magic:
+            raise ValueError("not a policy table")
+        count = struct.unpack_from("<Q", self.map, len(magic))[0]
+        # the table is used in place, nothing is parsed at startup
+        view = memoryview(self.map)
+        keysStart = len(magic) + 8
+        actionsStart = keysStart + count * 8
+        self.keys = view[keysStart:actionsStart].cast("Q")
+        self.actions = view[actionsStart:actionsStart + count]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __reduce__(self):
+        # the mapping stays in place, an unpickled table opens it again
+        return getTable, (self.path,)
+
+    def lookup(self, key):
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.actions[index]
+        return None
+
+    def close(self):
+        self.keys.release()
+        self.actions.release()
+        self.map.close()
+        self.file.close()
+
+
+def getTable(path):
+    with tablesLock:
+        table = tables.get(os.path.abspath(path))
+        if table is None:
+            table = PolicyTable(path)
+            tables[os.path.abspath(path)] = table
+        return table
+
+
+def writeTable(path, table):
+    keys = array("Q", sorted(table))
+    actions = array("B", [table[key] for key in keys])
+    with open(path, "wb") as output:
+        output.write(magic)
+        output.write(struct.pack("<Q", len(keys)))
+        output.write(keys.tobytes())
+        output.write(actions.tobytes())
+
+
+class TablePolicyAI(mechanics.AI):
+    def __init__(self, name, difficulty=0, rules=None, table=None,
+                 rng=None):
+        super().__init__(name, difficulty, rules, rng)
+        self.table = table
+
+    def chooseTurn(self, opponentSum, opponentRoundsWon,
+                   opponentPassed=False):
+        if self.table is not None:
+            key = getStateKey(self, opponentSum, opponentRoundsWon,
+                              opponentPassed)
+            action = self.table.lookup(key)
+            if action == 0:
+                return 0
+            if action is not None:
+                unit = getActionUnit(self, action)
+                if unit is not None:
+                    return unit
+        return super().chooseTurn(opponentSum, opponentRoundsWon,
+                                  opponentPassed)
+
+
+class ExploringAI(mechanics.AI):
+    def __init__(self, name, difficulty=0, epsilon=0.3, rng=None):
+        super().__init__(name, difficulty, rng=rng)
+        self.epsilon = epsilon
+        self.decisions = list()
+        self.statistics = dict()
+
+    def watch(self, events):
+        events.subscribe(mechanics.EventType.roundEnded, self.onRoundEnded)
+
+    def makeTurn(self, opponent, opponentPassed=False):
+        key = getStateKey(self, opponent.getSum(), opponent.roundsWon,
+                          opponentPassed)
+        if self.rng.random() < self.epsilon:
+            actions = [0] + sorted(set(getAction(unit) for unit in self.hand))
+            action = self.rng.choice(actions)
+            unit = 0 if action == 0 else getActionUnit(self, action)
+        else:
+            unit = super().makeTurn(opponent, opponentPassed)
+            action = getAction(unit)
+        self.decisions.append((key, action))
+        return unit
+
+    def onRoundEnded(self, player, subject):
+        mySum = self.getSum()
+        opponentSum = player.getSum()
+        reward = (mySum > opponentSum) - (mySum < opponentSum)
+        for decision in self.decisions:
+            total, visits = self.statistics.get(decision, (0, 0))
+            self.statistics[decision] = (total + reward, visits + 1)
+        self.decisions = list()
+
+
+def playTrainingBatch(task):
+    masterSeed, firstGame, games, difficulty, epsilon = task
+    policy = simulation.ReferencePolicy()
+    statistics = dict()
+    for game in range(firstGame, firstGame + games):
+        stream = streams.getStream(masterSeed, "train", game)
+        playerAI = ExploringAI("Training AI", difficulty, epsilon,
+                               stream.split("opponent"))
+        playerAI.statistics = statistics
+        match = simulation.createMatch(policy, playerAI, game % 2,
+                                       rng=stream.split("player"))
+        playerAI.watch(match.events)
+        match.play()
+    return statistics
+
+
+def train(games, workers=None, batchSize=500, difficulty=1, epsilon=0.3,
+          minVisits=5, masterSeed=0):
+    tasks = [(masterSeed, first, min(batchSize, games - first), difficulty,
+              epsilon) for first in range(0, games, batchSize)]
+    statistics = dict()
+    with Pool(workers) as pool:
+        for batch in pool.imap_unordered(playTrainingBatch, tasks):
+            for decision, (total, visits) in batch.items():
+                oldTotal, oldVisits = statistics.get(decision, (0, 0))
+                statistics[decision] = (oldTotal + total, oldVisits + visits)
+
+    best = dict()
+    for (key, action), (total, visits) in statistics.items():
+        if visits < minVisits:
+            continue
+        value = total / visits
+        if key not in best or value > best[key][1]:
+            best[key] = (action, value)
+    return {key: best[key][0] for key in best}
+
+
+def evaluate(table, games, difficulty=1, masterSeed=0):
+    policy = simulation.ReferencePolicy()
+    results = list()
+    for useTable in [False, True]:
+        wins = 0
+        for game in range(games):
+            stream = streams.getStream(masterSeed, "evaluate", game)
+            playerAI = TablePolicyAI("Evaluated AI", difficulty,
+                                     table=table if useTable else None,
+                                     rng=stream.split("opponent"))
+            match = simulation.createMatch(policy, playerAI, game % 2,
+                                           rng=stream.split("player"))
+            if match.play() == -1:
+                wins += 1
+        results.append(wins / games)
+    return results
+
+
+magic = b"GWPOL01\0"
+tables = dict()
+tablesLock = threading.Lock()
+strongUnit = 5
+gapStep = 4
+buckets = 3 * 2
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Train an AI policy table from simulated games."
+    )
+    parser.add_argument("output")
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--difficulty", type=int, default=1)
+    parser.add_argument("--epsilon", type=float, default=0.3)
+    parser.add_argument("--min-visits", type=int, default=5)
+    parser.add_argument("--evaluate", type=int, default=1000,
+                        help="games played to compare with the heuristic")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    table = train(arguments.games, arguments.workers,
+                  difficulty=arguments.difficulty,
+                  epsilon=arguments.epsilon,
+                  minVisits=arguments.min_visits,
+                  masterSeed=arguments.seed)
+    writeTable(arguments.output, table)
+    print("{} states written to {}".format(len(table), arguments.output))
+    if arguments.evaluate > 0:
+        policyTable = PolicyTable(arguments.output)
+        heuristic, trained = evaluate(policyTable, arguments.evaluate,
+                                      arguments.difficulty, arguments.seed)
+        print("AI win rate: heuristic {:.3f}, table {:.3f}".format(
+            heuristic, trained))
@@ -0,0 +1,134 @@
+import argparse
+import functools
+import threading
+import time
+import mechanics
+import policy
+import simulation
+
+
+class Profiler:
+    def __init__(self, targets=None):
+        self.targets = targets if targets is not None else defaultTargets
+        self.originals = list()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counts = dict()
+        self.times = dict()
+        self.stacks = dict()
+
+    def enable(self):
+        if len(self.originals) > 0:
+            return
+        # methods are swapped in place, so nothing is left behind when off
+        for owner, name in self.targets:
+            original = owner.__dict__[name]
+            label = "{}.{}".format(owner.__name__, name)
+            self.originals.append((owner, name, original))
+            setattr(owner, name, self.wrap(original, label))
+
+    def disable(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = list()
+
+    def wrap(self, function, label):
+        profiler = self
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = profiler.getStack()
+            frame = [label, 0.0]
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                path = ";".join(entry[0] for entry in stack)
+                stack.pop()
+                if len(stack) > 0:
+                    stack[-1][1] += elapsed
+                profiler.record(label, path, elapsed, elapsed - frame[1])
+        return wrapper
+
+    def getStack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = list()
+            self.local.stack = stack
+        return stack
+
+    def record(self, label, path, elapsed, selfTime):
+        with self.lock:
+            self.counts[label] = self.counts.get(label, 0) + 1
+            self.times[label] = self.times.get(label, 0.0) + elapsed
+            self.stacks[path] = self.stacks.get(path, 0.0) + selfTime
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict()
+            self.times = dict()
+            self.stacks = dict()
+
+    def getReport(self):
+        lines = ["{:<28}{:>10}{:>14}{:>12}".format("operation", "calls",
+                                                   "total ms", "us per call")]
+        for label in sorted(self.times, key=self.times.get, reverse=True):
+            count = self.counts[label]
+            total = self.times[label]
+            lines.append("{:<28}{:>10}{:>14.2f}{:>12.2f}".format(
+                label, count, total * 1e3, total / count * 1e6
+            ))
+        return "\n".join(lines)
+
+    def getCollapsedStacks(self):
+        # self time in microseconds, the input format of flamegraph.pl
+        return ["{} {}".format(path, round(selfTime * 1e6))
+                for path, selfTime in sorted(self.stacks.items())]
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exception):
+        self.disable()
+
+
+def runMatches(games, difficulty=1):
+    policy = simulation.ReferencePolicy()
+    for game in range(games):
+        playerAI = mechanics.AI("Profiled AI", difficulty)
+        simulation.createMatch(policy, playerAI, game % 2).play()
+
+
+defaultTargets = [
+    (mechanics.Unit, "play"),
+    (mechanics.Commander, "play"),
+    (mechanics.Spy, "play"),
+    (mechanics.Player, "drawCard"),
+    (mechanics.AI, "makeTurn"),
+    # web speculation calls chooseTurn directly from its worker threads
+    (mechanics.AI, "chooseTurn"),
+    (policy.TablePolicyAI, "chooseTurn"),
+    (mechanics.DeckGenerator, "generateDeck")
+]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Profile engine operations in simulated games."
+    )
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--difficulty", type=int, default=1)
+    parser.add_argument("--output", default=None,
+                        help="file for collapsed stacks")
+    arguments = parser.parse_args()
+
+    profiler = Profiler()
+    with profiler:
+        runMatches(arguments.games, arguments.difficulty)
+    print(profiler.getReport())
+    if arguments.output is not None:
+        with open(arguments.output, "w") as output:
+            output.write("\n".join(profiler.getCollapsedStacks()) + "\n")
@@ -0,0 +1,434 @@
+import argparse
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import urllib.parse
+import uuid
+from http.cookies import SimpleCookie
+
+
+def getPoint(key):
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class HashRing:
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self.points = list()
+        self.owners = dict()
+        for node in nodes:
+            self.addNode(node)
+
+    def addNode(self, node):
+        for i in range(self.replicas):
+            point = getPoint("{}#{}".format(node, i))
+            bisect.insort(self.points, point)
+            self.owners[point] = node
+
+    def removeNode(self, node):
+        self.points = [point for point in self.points
+                       if self.owners[point] != node]
+        self.owners = {point: self.owners[point] for point in self.points}
+
+    def getNode(self, key):
+        index = bisect.bisect(self.points, getPoint(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+    def getNodes(self):
+        return sorted(set(self.owners.values()))
+
+
+class ReadWriteLock:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing = False
+
+    def acquireRead(self):
+        with self.condition:
+            while self.writing:
+                self.condition.wait()
+            self.readers += 1
+
+    def releaseRead(self):
+        with self.condition:
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+    def acquireWrite(self):
+        with self.condition:
+            while self.writing:
+                self.condition.wait()
+            self.writing = True
+            while self.readers > 0:
+                self.condition.wait()
+
+    def releaseWrite(self):
+        with self.condition:
+            self.writing = False
+            self.condition.notify_all()
+
+
+def serveShard(name, connection):
+    # every shard writes its own game log files
+    os.environ["GWENT_GAME_LOG_PREFIX"] = name
+    import web
+    client = web.gwentWeb.test_client(use_cookies=False)
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == "request":
+            method, path, headers, body = message[1:]
+            response = client.open(path, method=method, headers=headers,
+                                   data=body)
+            connection.send((response.status, list(response.headers.items()),
+                             response.get_data()))
+        elif command == "export":
+            ring = HashRing(message[1], message[2])
+            games = web.games.popGames(
+                lambda gameId: ring.getNode(gameId) != name
+            )
+            exported = dict()
+            for gameId, game in games.items():
+                with game.lock:
+                    web.speculator.discard(game)
+                    exported[gameId] = pickle.dumps(game)
+            connection.send(exported)
+        elif command == "import":
+            web.games.addGames({gameId: pickle.loads(data)
+                                for gameId, data in message[1].items()})
+            connection.send(len(message[1]))
+        elif command == "spectated":
+            game = web.games.findSpectated(message[1])
+            connection.send(game.gameId if game is not None else None)
+        elif command == "existing":
+            connection.send([gameId for gameId in message[1]
+                             if web.games.findGame(gameId) is not None])
+        elif command == "count":
+            connection.send(len(web.games.games))
+        elif command == "stop":
+            connection.send(None)
+            connection.close()
+            return
+
+
+class Shard:
+    def __init__(self, name, context):
+        self.name = name
+        self.lock = threading.Lock()
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serveShard, args=(name, child),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+
+    def call(self, *message):
+        with self.lock:
+            self.connection.send(message)
+            return self.connection.recv()
+
+    def stop(self):
+        self.call("stop")
+        self.process.join()
+        self.connection.close()
+
+
+def getHeaders(environ):
+    headers = list()
+    for key, value in environ.items():
+        if key.startswith("HTTP_") and key != "HTTP_COOKIE":
+            headers.append((key[5:].replace("_", "-").title(), value))
+    for key in ["CONTENT_TYPE", "CONTENT_LENGTH"]:
+        if environ.get(key):
+            headers.append((key.replace("_", "-").title(), environ[key]))
+    return headers
+
+
+class Router:
+    def __init__(self, shards=None, replicas=64):
+        # fresh interpreters, a forked copy of the app would inherit threads
+        self.context = multiprocessing.get_context("spawn")
+        self.replicas = replicas
+        self.ring = HashRing(replicas=replicas)
+        self.shards = dict()
+        self.lock = ReadWriteLock()
+        self.shardCounter = 0
+        # spectator tokens follow their game id, which survives migrations
+        self.spectated = dict()
+        self.spectatedLock = threading.Lock()
+        for i in range(shards if shards is not None else os.cpu_count()):
+            self.addShard()
+
+    def addShard(self):
+        name = "shard{}".format(self.shardCounter)
+        self.shardCounter += 1
+        shard = Shard(name, self.context)
+        self.lock.acquireWrite()
+        try:
+            self.shards[name] = shard
+            self.ring.addNode(name)
+            self.migrate(list(self.shards.values()))
+        finally:
+            self.lock.releaseWrite()
+        return name
+
+    def removeShard(self, name):
+        self.lock.acquireWrite()
+        try:
+            shard = self.shards.pop(name)
+            self.ring.removeNode(name)
+            self.migrate([shard])
+        finally:
+            self.lock.releaseWrite()
+        shard.stop()
+
+    def migrate(self, sources):
+        # only games whose owner changed on the ring are moved
+        moved = dict()
+        for shard in sources:
+            games = shard.call("export", self.ring.getNodes(), self.replicas)
+            for gameId, data in games.items():
+                owner = self.ring.getNode(gameId)
+                moved.setdefault(owner, dict())[gameId] = data
+        for owner, games in moved.items():
+            self.shards[owner].call("import", games)
+
+    def getCounts(self):
+        self.lock.acquireRead()
+        try:
+            return {name: shard.call("count")
+                    for name, shard in self.shards.items()}
+        finally:
+            self.lock.releaseRead()
+
+    def close(self):
+        self.lock.acquireWrite()
+        try:
+            for shard in self.shards.values():
+                shard.stop()
+            self.shards = dict()
+        finally:
+            self.lock.releaseWrite()
+
+    def routeBatch(self, environ, startResponse):
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        try:
+            request = json.loads(environ["wsgi.input"].read(length))
+            create = request.get("create")
+            actions = request.get("actions", list())
+            if not isinstance(actions, list) or len(actions) > maxBatch:
+                raise ValueError("bad actions")
+            gameIds = None
+            if create is not None:
+                gameIds = getCreatedIds(create)
+            # malformed entries still reach a shard to get their own error
+            owners = [str(entry[0]) if isinstance(entry, list) and
+                      len(entry) > 0 else "" for entry in actions]
+        except (ValueError, TypeError, AttributeError, IndexError, KeyError):
+            return sendJson(startResponse, "400 BAD REQUEST",
+                            {"error": "bad batch request"})
+
+        self.lock.acquireRead()
+        try:
+            parts = dict()
+            for gameId in gameIds or list():
+                part = parts.setdefault(self.ring.getNode(gameId),
+                                        ([], [], []))
+                part[0].append(gameId)
+            # nothing is sent while any part could still be refused
+            for name, part in parts.items():
+                if len(part[0]) > 0 and \
+                        self.shards[name].call("existing", part[0]):
+                    return sendJson(startResponse, "400 BAD REQUEST",
+                                    {"error": "games already exist"})
+            for position, (entry, gameId) in enumerate(zip(actions, owners)):
+                part = parts.setdefault(self.ring.getNode(gameId),
+                                        ([], [], []))
+                part[1].append(entry)
+                part[2].append(position)
+            replies = dict()
+            workers = [threading.Thread(
+                target=self.sendBatch,
+                args=(name, create, part, replies)
+            ) for name, part in parts.items()]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            self.lock.releaseRead()
+
+        created = list()
+        results = [None for entry in actions]
+        for name, (status, reply) in replies.items():
+            if not status.startswith("200"):
+                return sendJson(startResponse, status, reply)
+            created.extend(reply["created"])
+            for position, result in zip(parts[name][2], reply["results"]):
+                results[position] = result
+        order = {gameId: i for i, gameId in enumerate(gameIds or [])}
+        created.sort(key=lambda entry: order[entry[0]])
+        return sendJson(startResponse, "200 OK",
+                        {"created": created, "results": results})
+
+    def sendBatch(self, name, create, part, replies):
+        request = {"actions": part[1]}
+        if len(part[0]) > 0:
+            request["create"] = dict(create, ids=part[0])
+        status, headers, data = self.shards[name].call(
+            "request", "POST", "/api/batch",
+            [("Content-Type", "application/json")],
+            json.dumps(request).encode()
+        )
+        replies[name] = (status, json.loads(data))
+
+    def routeStats(self, path, startResponse):
+        # counters live in every shard, so they are summed up here
+        self.lock.acquireRead()
+        try:
+            replies = [shard.call("request", "GET", path, list(), b"")
+                       for shard in self.shards.values()]
+        finally:
+            self.lock.releaseRead()
+        totals = dict()
+        for status, headers, data in replies:
+            if not status.startswith("200"):
+                startResponse(status, headers)
+                return [data]
+            for key, value in json.loads(data).items():
+                totals[key] = totals.get(key, 0) + value
+        if "hitRate" in totals:
+            total = totals["hits"] + totals["misses"]
+            totals["hitRate"] = totals["hits"] / total if total > 0 else 0.0
+        return sendJson(startResponse, "200 OK", totals)
+
+    def findSpectated(self, spectatorId):
+        with self.spectatedLock:
+            gameId = self.spectated.get(spectatorId)
+        if gameId is None:
+            # only the first view of a token asks every shard
+            for shard in self.shards.values():
+                gameId = shard.call("spectated", spectatorId)
+                if gameId is not None:
+                    break
+            else:
+                # an unknown token goes to any shard, which answers 404
+                return next(iter(self.shards.values()))
+            with self.spectatedLock:
+                self.spectated[spectatorId] = gameId
+        return self.shards[self.ring.getNode(gameId)]
+
+    def __call__(self, environ, startResponse):
+        path = environ.get("PATH_INFO", "/")
+        if path == "/api/batch" and environ["REQUEST_METHOD"] == "POST":
+            return self.routeBatch(environ, startResponse)
+        if path.startswith("/stats/") and environ["REQUEST_METHOD"] == "GET":
+            return self.routeStats(path, startResponse)
+        cookie = SimpleCookie(environ.get("HTTP_COOKIE", ""))
+        headers = getHeaders(environ)
+        newGame = False
+        spectatorId = None
+        if path.startswith("/spectate/"):
+            # spectator tokens are not on the ring, so their owner is asked
+            spectatorId = path[len("/spectate/"):]
+        elif path.startswith("/assets/") or path == "/favicon.ico":
+            # assets are cached by clients, they must not carry a new cookie
+            gameId = path
+        elif "gameId" in cookie:
+            gameId = cookie["gameId"].value
+        elif environ["REQUEST_METHOD"] != "POST":
+            # games are stored by their first action, any shard renders a page
+            gameId = path
+        else:
+            # the router picks the id, so the game is created on its owner
+            gameId = uuid.uuid4().hex
+            newGame = True
+            cookie["gameId"] = gameId
+        cookieHeader = "; ".join("{}={}".format(key, morsel.value)
+                                 for key, morsel in cookie.items())
+        if len(cookieHeader) > 0:
+            headers.append(("Cookie", cookieHeader))
+
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length > 0 else b""
+        route = urllib.parse.quote(path)
+        if environ.get("QUERY_STRING"):
+            route += "?" + environ["QUERY_STRING"]
+
+        self.lock.acquireRead()
+        try:
+            if spectatorId is not None:
+                shard = self.findSpectated(spectatorId)
+            else:
+                shard = self.shards[self.ring.getNode(gameId)]
+            status, responseHeaders, data = shard.call(
+                "request", environ["REQUEST_METHOD"], route, headers, body
+            )
+        finally:
+            self.lock.releaseRead()
+        if spectatorId is not None and status.startswith("404"):
+            # a restarted game gets a new token, the old one is forgotten
+            with self.spectatedLock:
+                self.spectated.pop(spectatorId, None)
+        if newGame:
+            responseHeaders.append(("Set-Cookie",
+                                    "gameId={}; HttpOnly; Path=/".format(
+                                        gameId)))
+        startResponse(status, responseHeaders)
+        return [data]
+
+
+def getCreatedIds(create):
+    # the checks of web.createGames, so that no shard refuses its part
+    difficulty = int(create.get("difficulty", 0))
+    fraction = int(create.get("fraction", 0))
+    gameIds = create.get("ids")
+    if gameIds is None:
+        # ids are chosen here, so each game starts on its owner
+        count = int(create.get("count", 1))
+        if not 0 <= count <= maxBatch:
+            raise ValueError("bad game count")
+        gameIds = [uuid.uuid4().hex for i in range(count)]
+    elif not isinstance(gameIds, list) or \
+            not all(isinstance(gameId, str) for gameId in gameIds):
+        raise ValueError("ids must be a list of strings")
+    if not 0 <= difficulty <= 3 or not 0 <= fraction <= 1 or \
+            len(gameIds) > maxBatch or len(set(gameIds)) < len(gameIds) or \
+            not isinstance(create.get("locale", ""), str):
+        raise ValueError("bad game creation request")
+    return gameIds
+
+
+def sendJson(startResponse, status, value):
+    data = json.dumps(value, separators=(",", ":")).encode()
+    startResponse(status, [("Content-Type", "application/json"),
+                           ("Content-Length", str(len(data)))])
+    return [data]
+
+
+# the same limit as web.maxBatch, the router does not import the app
+maxBatch = 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve the game from several worker processes."
+    )
+    parser.add_argument("--shards", type=int, default=None,
+                        help="worker processes, one per core if omitted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    arguments = parser.parse_args()
+
+    from werkzeug.serving import run_simple
+    router = Router(arguments.shards)
+    try:
+        run_simple(arguments.host, arguments.port, router, threaded=True)
+    finally:
+        router.close()
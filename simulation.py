@@ -0,0 +1,144 @@
+import mechanics
+import streams
+
+
+def getHand(player):
+    return list(player.hand)
+
+
+def getAddedStrength(player, unit):
+    return unit.strength + player.rows[unit.rowType].activeCommanders
+
+
+class ReferencePolicy:
+    def __init__(self, passMargin=10):
+        self.passMargin = passMargin
+
+    def makeTurn(self, player, opponent, opponentPassed=False):
+        mySum = player.getSum()
+        opponentSum = opponent.getSum()
+        options = getHand(player)
+        if len(options) == 0:
+            return 0
+        options.sort(key=lambda unit: getAddedStrength(player, unit))
+
+        # opponent will not answer, so play the cheapest winning unit
+        if opponentPassed:
+            if mySum > opponentSum:
+                return 0
+            for unit in options:
+                if mySum + getAddedStrength(player, unit) > opponentSum:
+                    return unit
+            return 0
+
+        if mySum > opponentSum + self.passMargin:
+            return 0
+
+        # spies are free cards, so play them as early as possible
+        for unit in options:
+            if isinstance(unit, mechanics.Spy):
+                return unit
+        for unit in options:
+            if mySum + getAddedStrength(player, unit) > opponentSum:
+                return unit
+        return options[-1]
+
+
+class RandomPolicy:
+    def __init__(self, passChance=0.1, rng=None):
+        self.passChance = passChance
+        self.rng = rng if rng is not None else streams.globalRandom
+
+    def makeTurn(self, player, opponent, opponentPassed=False):
+        options = player.hand.units
+        if len(options) == 0 or self.rng.random() < self.passChance:
+            return 0
+        return self.rng.choice(options)
+
+
+class PassPolicy:
+    def makeTurn(self, player, opponent, opponentPassed=False):
+        return 0
+
+
+class AIPolicy:
+    def makeTurn(self, player, opponent, opponentPassed=False):
+        return player.makeTurn(opponent, opponentPassed)
+
+
+class Match:
+    def __init__(self, player, policy, opponent):
+        self.player = player
+        self.policy = policy
+        self.opponent = opponent
+        self.opponentPassed = False
+        self.rounds = 0
+        self.events = mechanics.EventBus()
+        player.setEvents(self.events)
+        opponent.setEvents(self.events)
+
+    def play(self):
+        while self.rounds < Match.maxRounds:
+            self.playRound()
+            if self.player.roundsWon == self.player.rules.roundWinCondition:
+                return 1
+            if self.opponent.roundsWon == \
+                    self.opponent.rules.roundWinCondition:
+                return -1
+            self.newRound()
+        return 0
+
+    def playRound(self):
+        self.opponentPassed = False
+        while True:
+            unit = self.policy.makeTurn(self.player, self.opponent,
+                                        self.opponentPassed)
+            if unit == 0:
+                self.events.emit(mechanics.EventType.turnPassed, self.player)
+                if not self.opponentPassed:
+                    self.opponentTurn(lastTurn=True)
+                break
+            unit.play()
+            if self.opponentPassed:
+                break
+            self.opponentTurn()
+        self.endRound()
+
+    def opponentTurn(self, lastTurn=False):
+        unit = self.opponent.makeTurn(self.player, lastTurn)
+        if unit != 0:
+            unit.play()
+            return
+        self.events.emit(mechanics.EventType.turnPassed, self.opponent)
+        if not lastTurn:
+            self.opponentPassed = True
+
+    def endRound(self):
+        self.events.emit(mechanics.EventType.roundEnded, self.player)
+        sum1 = self.player.getSum()
+        sum2 = self.opponent.getSum()
+        if sum1 > sum2:
+            self.player.winRound()
+        elif sum1 < sum2:
+            self.opponent.winRound()
+        self.rounds += 1
+
+    def newRound(self):
+        self.player.drawCard()
+        self.opponent.drawCard()
+        self.player.clearRows()
+        self.opponent.clearRows()
+
+    # ties may repeat while both decks are empty, so cap the game length
+    maxRounds = 10
+
+
+def createMatch(policy, opponent, fraction=mechanics.Fraction.north,
+                deckGenerator=None, rng=None):
+    if deckGenerator is None:
+        deckGenerator = mechanics.DeckGenerator(opponent.rules, rng)
+    player = mechanics.Player("Reference Player", fraction, opponent.rules,
+                              rng)
+    player.generateDeck(deckGenerator)
+    opponent.generateDeck(deckGenerator)
+    return Match(player, policy, opponent)
@@ -0,0 +1,123 @@
+import hashlib
+import random
+
+
+def getBlock(counter, key):
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    for i in range(rounds):
+        if i > 0:
+            k0 = (k0 + weyl0) & mask
+            k1 = (k1 + weyl1) & mask
+        product0 = multiplier0 * c0
+        product1 = multiplier1 * c2
+        c0, c1, c2, c3 = ((product1 >> 32) ^ c1 ^ k0, product1 & mask,
+                          (product0 >> 32) ^ c3 ^ k1, product0 & mask)
+    return c0, c1, c2, c3
+
+
+class PhiloxRandom:
+    def __init__(self, key, counter=0, batchBlocks=4):
+        self.key = key & 0xFFFFFFFFFFFFFFFF
+        self.counter = counter
+        self.batchBlocks = batchBlocks
+        self.words = list()
+        self.position = 0
+        self.bits = 0
+        self.bitCount = 0
+
+    def fill(self):
+        # blocks are computed a batch at a time, draws then only index a list
+        key = (self.key & mask, self.key >> 32)
+        words = list()
+        for counter in range(self.counter, self.counter + self.batchBlocks):
+            words.extend(getBlock((counter & mask, (counter >> 32) & mask,
+                                   (counter >> 64) & mask, counter >> 96),
+                                  key))
+        self.counter += self.batchBlocks
+        self.words = words
+        self.position = 0
+
+    def getWord(self):
+        if self.position == len(self.words):
+            self.fill()
+        word = self.words[self.position]
+        self.position += 1
+        return word
+
+    def getrandbits(self, k):
+        # most draws need a few bits, so words are spent bit by bit
+        while self.bitCount < k:
+            self.bits |= self.getWord() << self.bitCount
+            self.bitCount += 32
+        value = self.bits & ((1 << k) - 1)
+        self.bits >>= k
+        self.bitCount -= k
+        return value
+
+    def random(self):
+        return self.getrandbits(53) * (1.0 / 9007199254740992.0)
+
+    def randbelow(self, n):
+        if n <= 0:
+            raise ValueError("randbelow needs a positive bound")
+        k = n.bit_length()
+        value = self.getrandbits(k)
+        while value >= n:
+            value = self.getrandbits(k)
+        return value
+
+    def randint(self, a, b):
+        if b < a:
+            raise ValueError("empty range for randint({}, {})".format(a, b))
+        return a + self.randbelow(b - a + 1)
+
+    def choice(self, sequence):
+        if len(sequence) == 0:
+            raise IndexError("cannot choose from an empty sequence")
+        return sequence[self.randbelow(len(sequence))]
+
+    def shuffle(self, sequence):
+        for i in reversed(range(1, len(sequence))):
+            j = self.randbelow(i + 1)
+            sequence[i], sequence[j] = sequence[j], sequence[i]
+
+    def split(self, name):
+        return getStream(self.key, name)
+
+
+class GlobalRandom:
+    # the default stream, kept as an object so that players stay picklable
+    def random(self):
+        return random.random()
+
+    def getrandbits(self, k):
+        return random.getrandbits(k)
+
+    def randint(self, a, b):
+        return random.randint(a, b)
+
+    def choice(self, sequence):
+        return random.choice(sequence)
+
+    def shuffle(self, sequence):
+        random.shuffle(sequence)
+
+    def split(self, name):
+        return self
+
+
+def getStream(masterSeed, *path):
+    # a stream depends only on its path, never on who else draws numbers
+    name = ":".join(str(part) for part in (masterSeed,) + path)
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return PhiloxRandom(int.from_bytes(digest, "little"))
+
+
+globalRandom = GlobalRandom()
+mask = 0xFFFFFFFF
+rounds = 10
+multiplier0 = 0xD2511F53
+multiplier1 = 0xCD9E8D57
+weyl0 = 0x9E3779B9
+weyl1 = 0xBB67AE85
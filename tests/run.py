@@ -2,8 +2,10 @@ import unittest
 import units
 import scenarios
 
-runner = unittest.TextTestRunner(verbosity=2)
-print("Processing unit tests...")
-runner.run(units.getUnitTestSuit())
-print("Processing scenario tests...")
-runner.run(scenarios.getScenarioTestSuit())
+# shard workers are spawned and import the main module again
+if __name__ == '__main__':
+    runner = unittest.TextTestRunner(verbosity=2)
+    print("Processing unit tests...")
+    runner.run(units.getUnitTestSuit())
+    print("Processing scenario tests...")
+    runner.run(scenarios.getScenarioTestSuit())
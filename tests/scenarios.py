@@ -1,6 +1,20 @@
+import concurrent.futures
+import gzip
+import json
+import os
+import pickle
+import re
+import tempfile
+import threading
 import unittest
+from random import Random
+import werkzeug.test
 from web import Labeler
+import gamelog
+import loadtest
 import mechanics
+import sharding
+import web
 
 
 class TestBoardInteraction(unittest.TestCase):
@@ -92,6 +106,34 @@ class TestAI(unittest.TestCase):
                                 mechanics.ConditionType.inHand)
                 choice.play()
 
+    def testFinishingSearch(self):
+        playerAI = mechanics.HandBuffingAI(self.playerAI)
+        opponent = mechanics.Player("Test Player", 0)
+        opponent.generateDeck(self.deckGenerator)
+        for i in range(mechanics.Player.deckSize):
+            playerAI.drawCard()
+            gains = [unit.strength +
+                     playerAI.rows[unit.rowType].activeCommanders
+                     for unit in playerAI.hand]
+            if len(gains) == 0:
+                break
+            for target in range(min(gains) - 1, max(gains) + 2):
+                opponentSum = playerAI.getSum() + target - 1
+                choice = playerAI.chooseTurn(opponentSum, 0, True)
+                # the first unit in the deck that is enough, as a scan finds
+                expected = 0
+                for unit in playerAI.deck:
+                    if unit.condition == mechanics.ConditionType.inHand and \
+                            unit.strength + playerAI.rows[
+                                unit.rowType].activeCommanders >= target:
+                        expected = unit
+                        break
+                self.assertIs(choice, expected)
+            playerAI.makeTurn(opponent)
+            playerAI.hand.units[0].play()
+            if i % 5 == 4:
+                playerAI.clearRows()
+
 
 class TestCheats(unittest.TestCase):
     def setUp(self):
@@ -149,6 +191,607 @@ class TestLabelers(unittest.TestCase):
             self.assertEqual(len(labels[i].split(" ")), count[i])
 
 
+def checkInvariants(test, game):
+    test.assertIsNotNone(game.player1)
+    for player in [game.player1, game.player2]:
+        inGame = 0
+        for row in player.rows:
+            test.assertEqual(row.sum,
+                             sum(unit.strength for unit in row.units))
+            for unit in row.units:
+                test.assertEqual(unit.condition,
+                                 mechanics.ConditionType.inGame)
+            inGame += len(row.units)
+        test.assertEqual(inGame, sum(
+            1 for unit in player.deck
+            if unit.condition == mechanics.ConditionType.inGame
+        ))
+        test.assertLessEqual(player.deckTop, mechanics.Player.deckSize)
+        for unit in player.deck[player.deckTop:]:
+            test.assertEqual(unit.condition,
+                             mechanics.ConditionType.inDeck)
+    labels = game.manager.unitsInterface.buttonLabels
+    test.assertEqual(len(labels), game.player1.deckTop)
+    for unit, label in zip(game.player1.deck, labels):
+        test.assertEqual(label is not None, unit.condition ==
+                         mechanics.ConditionType.inHand)
+
+
+class TestConcurrentGames(unittest.TestCase):
+    def setUp(self):
+        self.app = web.gwentWeb
+
+    def hammer(self, gameId, seed, requests):
+        client = self.app.test_client()
+        client.set_cookie("gameId", gameId)
+        random = Random(seed)
+        client.post("/difficulty", data={"hard": ""})
+        client.post("/fraction", data={"north": ""})
+        for i in range(requests):
+            route = random.choice(["/play", "/play", "/play", "/pass",
+                                   "/dismissPass", "/continue"])
+            form = {"unit": str(random.randint(0, 24))}
+            client.post(route, data=form)
+            client.get("/")
+
+    def runThreads(self, gameIds, threads, requests):
+        workers = [threading.Thread(target=self.hammer,
+                                    args=(gameIds[i % len(gameIds)], i,
+                                          requests))
+                   for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def testSingleGame(self):
+        self.runThreads(["single"], 8, 100)
+        checkInvariants(self, web.games.getGame("single"))
+
+    def testPagesWithoutGames(self):
+        client = self.app.test_client()
+        count = len(web.games.games)
+        for i in range(20):
+            response = client.get("/")
+            self.assertNotIn("Set-Cookie", response.headers)
+        self.assertEqual(len(web.games.games), count)
+        response = client.post("/difficulty", data={"easy": ""})
+        self.assertIn("Set-Cookie", response.headers)
+        self.assertEqual(len(web.games.games), count + 1)
+
+    def testManyGames(self):
+        gameIds = ["many" + str(i) for i in range(16)]
+        self.runThreads(gameIds, 32, 50)
+        for gameId in gameIds:
+            checkInvariants(self, web.games.getGame(gameId))
+
+
+class TestSpectators(unittest.TestCase):
+    def setUp(self):
+        self.client = web.gwentWeb.test_client()
+        self.client.set_cookie("gameId", "spectated")
+        self.client.post("/difficulty", data={"easy": ""})
+        self.client.post("/fraction", data={"north": ""})
+        self.game = web.games.getGame("spectated")
+        self.url = "/spectate/" + self.game.spectatorId
+
+    def testSharedRender(self):
+        first = self.client.get(self.url)
+        page = self.game.spectatorPage
+        for i in range(20):
+            response = self.client.get(self.url)
+            self.assertEqual(response.get_data(), first.get_data())
+        self.assertIs(self.game.spectatorPage, page)
+        self.assertNotIn(b'name="unit"', first.get_data())
+
+        unit = self.game.player1.hand.units[0]
+        self.client.post("/play", data={
+            "unit": str(self.game.player1.deck.index(unit))
+        })
+        self.client.get(self.url)
+        self.assertIsNot(self.game.spectatorPage, page)
+        self.assertEqual(self.game.spectatorPage[0], self.game.version)
+
+    def testConditionalRequest(self):
+        response = self.client.get(self.url)
+        etag = response.headers["ETag"]
+        response = self.client.get(self.url,
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def testUnknownGame(self):
+        response = self.client.get("/spectate/unknown")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/spectate/spectated")
+        self.assertEqual(response.status_code, 404)
+
+    def testCookieHidden(self):
+        page = self.client.get("/").get_data(as_text=True)
+        self.assertIn(self.url, page)
+        self.assertNotIn("spectated", page)
+        self.assertNotIn("spectated",
+                         self.client.get(self.url).get_data(as_text=True))
+
+
+class TestSpeculation(unittest.TestCase):
+    def setUp(self):
+        self.client = web.gwentWeb.test_client()
+
+    def startGame(self, gameId, difficulty):
+        self.client.set_cookie("gameId", gameId)
+        self.client.post("/difficulty", data={difficulty: ""})
+        self.client.post("/fraction", data={"north": ""})
+        return web.games.getGame(gameId)
+
+    def testRepliesPrepared(self):
+        game = self.startGame("speculated", "easy")
+        self.assertEqual(game.speculationVersion, game.version)
+        self.assertEqual(sorted(game.speculations), [
+            index for index, unit in enumerate(game.player1.deck)
+            if unit.condition == mechanics.ConditionType.inHand
+        ])
+
+        hits = web.speculator.getReport()["hits"]
+        index = min(game.speculations)
+        concurrent.futures.wait(game.speculations.values())
+        self.client.post("/play", data={"unit": str(index)})
+        self.assertEqual(web.speculator.getReport()["hits"], hits + 1)
+        self.assertEqual(game.player1.deck[index].condition,
+                         mechanics.ConditionType.inGame)
+        if game.state == web.GameState.playing:
+            self.assertEqual(game.speculationVersion, game.version)
+
+    def testSameAsInline(self):
+        game = self.startGame("speculatedTwin", "medium")
+        for i in range(6):
+            if game.state != web.GameState.playing or \
+                    len(game.speculations) == 0:
+                break
+            concurrent.futures.wait(game.speculations.values())
+            twin = pickle.loads(pickle.dumps(game))
+            index = max(game.speculations)
+            self.client.post("/play", data={"unit": str(index)})
+            twin.processUnit(index)
+            self.assertEqual(twin.state, game.state)
+            for player, copied in [(game.player1, twin.player1),
+                                   (game.player2, twin.player2)]:
+                self.assertEqual(
+                    [(unit.condition, unit.strength) for unit in player.deck],
+                    [(unit.condition, unit.strength) for unit in copied.deck]
+                )
+            self.assertEqual(game.player2.rng.getrandbits(64),
+                             twin.player2.rng.getrandbits(64))
+
+    def testQueuedPrediction(self):
+        game = self.startGame("speculatedLate", "easy")
+        speculator = web.speculator
+        web.speculator = web.Speculator(1)
+        blocker = threading.Event()
+        web.speculator.executor.submit(blocker.wait)
+        try:
+            with game.lock:
+                web.speculator.speculate(game)
+            report = web.speculator.getReport()
+            self.client.post("/play", data={"unit": str(min(
+                game.speculations))})
+            self.assertEqual(web.speculator.getReport()["hits"],
+                             report["hits"])
+            self.assertEqual(web.speculator.getReport()["misses"],
+                             report["misses"] + 1)
+        finally:
+            blocker.set()
+            with game.lock:
+                web.speculator.discard(game)
+            web.speculator.executor.shutdown()
+            web.speculator = speculator
+
+    def testCheatingAISkipped(self):
+        game = self.startGame("speculatedCheater", "cheater")
+        self.assertEqual(len(game.speculations), 0)
+
+    def testReport(self):
+        report = self.client.get("/stats/speculation").get_json()
+        for key in ["hits", "misses", "hitRate", "savedMs"]:
+            self.assertIn(key, report)
+
+
+class TestAutoResolve(unittest.TestCase):
+    def setUp(self):
+        self.client = web.gwentWeb.test_client()
+        self.client.set_cookie("gameId", "resolved")
+        self.client.post("/difficulty", data={"medium": ""})
+        self.client.post("/fraction", data={"north": ""})
+        self.game = web.games.getGame("resolved")
+
+    def testResolveRound(self):
+        for policyName in ["reference", "random", "pass"]:
+            self.client.post("/autoResolve", data={"policy": policyName})
+            self.assertIn(self.game.state, [web.GameState.notifyingEndRound,
+                                            web.GameState.notifyingEndGame])
+            summary = self.game.autoSummary
+            self.assertGreater(len(summary), 0)
+            self.assertEqual(summary[-1][2:], (self.game.player1.getSum(),
+                                               self.game.player2.getSum()))
+            page = self.client.get("/").get_data(as_text=True)
+            self.assertIn("<td>{} : {}</td>".format(*summary[-1][2:]), page)
+            checkInvariants(self, self.game)
+            if self.game.state == web.GameState.notifyingEndGame:
+                break
+            self.client.post("/continue")
+            self.assertEqual(self.game.autoSummary, list())
+
+    def testBatchSummary(self):
+        self.client.post("/restart")
+        self.client.post("/difficulty", data={"medium": ""})
+        self.client.post("/fraction", data={"north": ""})
+        results = self.client.post("/api/batch", json={
+            "actions": [["resolved", "autoResolve", "reference"]]
+        }).get_json()["results"]
+        summary = results[0][1]["autoSummary"]
+        self.assertGreater(len(summary), 0)
+        self.assertEqual(summary, [list(turn)
+                                   for turn in self.game.autoSummary])
+
+    def testFailingPolicy(self):
+        class FailingPolicy:
+            def makeTurn(self, player, opponent, opponentPassed=False):
+                raise RuntimeError("policy failed")
+
+        handlers = [list(handlers) for handlers in self.game.events.handlers]
+        with self.assertRaises(RuntimeError):
+            self.game.processAutoResolve(FailingPolicy())
+        self.assertEqual(self.game.events.handlers, handlers)
+
+    def testLoggedMatches(self):
+        directory = tempfile.TemporaryDirectory()
+        gameLog = web.gameLog
+        web.gameLog = gamelog.ColumnarLogWriter(directory.name)
+        try:
+            self.client.post("/restart")
+            self.client.post("/difficulty", data={"easy": ""})
+            self.client.post("/fraction", data={"north": ""})
+            matchIds = [self.game.matchId]
+            while len(matchIds) < 3:
+                self.client.post("/autoResolve", data={"policy": "pass"})
+                ended = self.game.state == web.GameState.notifyingEndGame
+                self.client.post("/continue")
+                if ended:
+                    matchIds.append(self.game.matchId)
+            web.gameLog.close()
+
+            reader = gamelog.ColumnarLogReader(os.path.join(
+                directory.name, os.listdir(directory.name)[0]
+            ))
+            numbers = list()
+            for column in reader.getColumn("gameId"):
+                numbers.extend(column.tolist())
+                column.release()
+            reader.close()
+            self.assertEqual(len(set(numbers)), 2)
+            self.assertEqual(len(set(matchIds)), 3)
+            self.assertEqual(set(numbers), {gamelog.getGameNumber(matchId)
+                                            for matchId in matchIds[:2]})
+        finally:
+            web.gameLog = gameLog
+            directory.cleanup()
+
+    def testOutsideOfRound(self):
+        self.client.post("/rules")
+        self.client.post("/autoResolve", data={"policy": "reference"})
+        self.assertEqual(self.game.state, web.GameState.displayingRules)
+        self.client.post("/dismissRules")
+        self.client.post("/autoResolve", data={"policy": "unknown"})
+        self.assertEqual(self.game.state, web.GameState.playing)
+
+
+class TestAssets(unittest.TestCase):
+    def setUp(self):
+        self.client = web.gwentWeb.test_client()
+        self.pipeline = web.assetPipeline
+
+    def testFingerprintedPage(self):
+        page = self.client.get("/").get_data(as_text=True)
+        self.assertNotIn("<style>", page)
+        for name in ["style.css", "icon.ico"]:
+            self.assertIn(self.pipeline.getUrl(name), page)
+        style = self.pipeline.assets["style.css"].data.decode()
+        self.assertIn(self.pipeline.assets["witcher.ttf"].fileName, style)
+
+    def testEncodings(self):
+        url = self.pipeline.getUrl("witcher.ttf")
+        plain = self.client.get(url)
+        self.assertEqual(plain.headers["Cache-Control"], web.assets.immutable)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        compressed = self.client.get(url, headers={
+            "Accept-Encoding": "br;q=0, gzip"
+        })
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertLess(len(compressed.get_data()), len(plain.get_data()))
+        self.assertEqual(gzip.decompress(compressed.get_data()),
+                         plain.get_data())
+
+        response = self.client.get(url, headers={
+            "If-None-Match": plain.headers["ETag"]
+        })
+        self.assertEqual(response.status_code, 304)
+
+    def testMissingAsset(self):
+        self.assertEqual(self.client.get("/assets/style.css").status_code,
+                         404)
+        icon = self.client.get("/favicon.ico")
+        self.assertEqual(icon.get_data(),
+                         self.pipeline.assets["icon.ico"].data)
+
+
+class TestLocales(unittest.TestCase):
+    def testAcceptLanguage(self):
+        client = web.gwentWeb.test_client()
+        client.set_cookie("gameId", "localized")
+        headers = {"Accept-Language": "ru-RU, ru;q=0.9, en;q=0.5"}
+        client.post("/difficulty", data={"medium": ""}, headers=headers)
+        client.post("/fraction", data={"north": ""}, headers=headers)
+        game = web.games.getGame("localized")
+        self.assertIs(game.texts, web.catalogs["ru"])
+        self.assertEqual(game.player1.name, "Вы")
+        page = client.get("/").get_data(as_text=True)
+        self.assertIn("Королевства Севера", page)
+
+        self.assertIs(web.Game().texts, web.defaultTexts)
+        self.assertIs(pickle.loads(pickle.dumps(game)).texts, game.texts)
+
+    def testBatchLocale(self):
+        client = web.gwentWeb.test_client()
+        reply = client.post("/api/batch", json={
+            "create": {"count": 1, "locale": "ru"}
+        }).get_json()
+        game = web.games.findGame(reply["created"][0][0])
+        self.assertEqual(game.player2.name, "Геральт из Ривии")
+        reply = client.post("/api/batch", json={
+            "create": {"count": 1, "locale": "xx"}
+        }).get_json()
+        game = web.games.findGame(reply["created"][0][0])
+        self.assertEqual(game.player2.name, "Geralt of Rivia")
+
+
+class TestBatchApi(unittest.TestCase):
+    def setUp(self):
+        self.client = web.gwentWeb.test_client()
+
+    def getActions(self, states):
+        actions = list()
+        for gameId, state in states.items():
+            if state["state"] == web.GameState.playing:
+                actions.append([gameId, "play", state["hand"][0][0]]
+                               if len(state["hand"]) > 0 else
+                               [gameId, "pass"])
+            elif state["state"] == web.GameState.notifyingPass:
+                actions.append([gameId, "dismissPass"])
+            elif state["state"] == web.GameState.notifyingEndRound:
+                actions.append([gameId, "continue"])
+        return actions
+
+    def testPlayManyGames(self):
+        response = self.client.post("/api/batch", json={
+            "create": {"difficulty": 1, "fraction": 1, "count": 100}
+        }).get_json()
+        states = dict(response["created"])
+        self.assertEqual(len(states), 100)
+        calls = 0
+        # ties repeat forever once both decks are empty, so cap the loop
+        while calls < 300:
+            actions = self.getActions(states)
+            if len(actions) == 0:
+                break
+            response = self.client.post("/api/batch",
+                                        json={"actions": actions})
+            self.assertEqual(response.status_code, 200)
+            for gameId, state in response.get_json()["results"]:
+                states[gameId] = state
+            calls += 1
+        self.assertLess(calls, 100)
+        for gameId, state in states.items():
+            self.assertEqual(state["state"], web.GameState.notifyingEndGame)
+            game = web.games.findGame(gameId)
+            self.assertEqual(state["sums"], [game.player1.getSum(),
+                                             game.player2.getSum()])
+            checkInvariants(self, game)
+
+    def testErrors(self):
+        created = self.client.post("/api/batch", json={
+            "create": {"ids": ["apiGame"]}
+        }).get_json()["created"]
+        self.assertEqual(created[0][0], "apiGame")
+        results = self.client.post("/api/batch", json={"actions": [
+            ["apiGame", "fly"], ["apiGame", "play", "first"],
+            ["unknownGame", "pass"], [], ["apiGame", "play", 99]
+        ]}).get_json()["results"]
+        self.assertEqual([result[1].get("error") for result in results],
+                         ["bad action", "bad action", "unknown game",
+                          "bad action", None])
+        self.assertEqual(results[4][1]["state"], web.GameState.playing)
+
+        for request in ["[]", "{", '{"create": {"difficulty": 7}}',
+                        '{"create": {"count": 100000000}}',
+                        '{"create": {"ids": [1, 2]}}',
+                        '{"create": {"ids": "apiGames"}}',
+                        '{"create": {"ids": ["apiGame"]}}',
+                        '{"create": {"ids": ["twice", "twice"]}}']:
+            response = self.client.post("/api/batch", data=request,
+                                        content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        self.assertIsNone(web.games.findGame("twice"))
+
+    def testRefusedActions(self):
+        count = len(web.games.games)
+        for actions in ["pass", {"apiGame": "pass"}, 5,
+                        [["apiGame", "pass"]] * (web.maxBatch + 1)]:
+            response = self.client.post("/api/batch", json={
+                "create": {"count": 3}, "actions": actions
+            })
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(len(web.games.games), count)
+
+    def testExistingGames(self):
+        browser = web.gwentWeb.test_client()
+        browser.set_cookie("gameId", "browserGame")
+        browser.post("/difficulty", data={"hard": ""})
+        browser.post("/fraction", data={"north": ""})
+        game = web.games.findGame("browserGame")
+        player = game.player1
+        response = self.client.post("/api/batch", json={
+            "create": {"ids": ["newGame", "browserGame"]}
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIs(game.player1, player)
+        self.assertIsNone(web.games.findGame("newGame"))
+
+
+class TestLoad(unittest.TestCase):
+    def testSmallLoad(self):
+        stats, elapsed = loadtest.runLoad(2, 1, app=web.gwentWeb)
+        self.assertEqual(stats.games, 2)
+        self.assertEqual(stats.errors, dict())
+        for route in ["GET /", "POST /difficulty", "POST /fraction",
+                      "POST /play"]:
+            self.assertIn(route, stats.samples)
+        self.assertEqual(len(stats.samples["POST /difficulty"]), 2)
+        self.assertEqual(len(stats.samples["POST /fraction"]), 2)
+        posts = sum(len(samples) for route, samples in stats.samples.items()
+                    if route.startswith("POST"))
+        # every action is followed by a page load, plus the first one
+        self.assertEqual(len(stats.samples["GET /"]), posts + 2)
+        report = stats.getReport(elapsed).splitlines()
+        self.assertTrue(report[0].startswith(
+            "{} requests, 2 games".format(posts * 2 + 2)
+        ))
+        self.assertEqual(len(report), len(stats.samples) + 2)
+
+
+class TestSharding(unittest.TestCase):
+    def testGameMigration(self):
+        client = web.gwentWeb.test_client()
+        client.set_cookie("gameId", "migrated")
+        client.post("/difficulty", data={"cheater": ""})
+        client.post("/fraction", data={"north": ""})
+        game = web.games.getGame("migrated")
+        moved = pickle.loads(pickle.dumps(game))
+        self.assertEqual(moved.player2.getSum(), game.player2.getSum())
+        self.assertEqual(moved.player1.hand.units[0].strength,
+                         game.player1.hand.units[0].strength)
+
+        unit = moved.player1.hand.units[0]
+        moved.processUnit(moved.player1.deck.index(unit))
+        self.assertEqual(unit.condition, mechanics.ConditionType.inGame)
+        checkInvariants(self, moved)
+
+    def testHashRing(self):
+        ring = sharding.HashRing(["a", "b", "c"])
+        gameIds = [str(i) for i in range(3000)]
+        owners = {gameId: ring.getNode(gameId) for gameId in gameIds}
+        for node in ["a", "b", "c"]:
+            self.assertGreater(list(owners.values()).count(node), 600)
+        ring.addNode("d")
+        moved = [gameId for gameId in gameIds
+                 if ring.getNode(gameId) != owners[gameId]]
+        self.assertLess(len(moved), 1200)
+        for gameId in moved:
+            self.assertEqual(ring.getNode(gameId), "d")
+
+    def testRouter(self):
+        router = sharding.Router(2)
+        try:
+            clients = [werkzeug.test.Client(router) for i in range(6)]
+            for client in clients:
+                client.post("/difficulty", data={"easy": ""})
+                client.post("/fraction", data={"north": ""})
+            pages = [client.get("/").get_data() for client in clients]
+            response = werkzeug.test.Client(router).get("/")
+            self.assertNotIn("Set-Cookie", response.headers)
+            self.assertEqual(sum(router.getCounts().values()), 6)
+            urls = [re.search(rb'href="(/spectate/\w+)"', page).group(1)
+                    for page in pages]
+            viewer = werkzeug.test.Client(router)
+            self.assertEqual(viewer.get(urls[0].decode()).status_code, 200)
+            self.assertEqual(len(router.spectated), 1)
+
+            router.addShard()
+            router.removeShard("shard0")
+            self.assertEqual(sum(router.getCounts().values()), 6)
+            for client, page, url in zip(clients, pages, urls):
+                self.assertEqual(client.get("/").get_data(), page)
+                self.assertEqual(viewer.get(url.decode()).status_code, 200)
+            response = viewer.get("/spectate/unknown")
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(len(router.spectated), 6)
+
+            # known tokens go straight to the owner of their game
+            commands = list()
+
+            def recordCalls(call):
+                def recorded(*message):
+                    commands.append(message[0])
+                    return call(*message)
+                return recorded
+
+            for shard in router.shards.values():
+                shard.call = recordCalls(shard.call)
+            for url in urls:
+                self.assertEqual(viewer.get(url.decode()).status_code, 200)
+            self.assertEqual(commands, ["request"] * 6)
+            for shard in router.shards.values():
+                del shard.call
+
+            client = werkzeug.test.Client(router)
+            created = client.post("/api/batch", json={
+                "create": {"count": 40}
+            }).get_json()["created"]
+            self.assertEqual(len(created), 40)
+            self.assertNotIn(0, router.getCounts().values())
+            actions = [[gameId, "play", state["hand"][0][0]]
+                       for gameId, state in reversed(created)]
+            actions.append([])
+            results = client.post("/api/batch", json={
+                "actions": actions
+            }).get_json()["results"]
+            self.assertEqual([result[0] for result in results[:-1]],
+                             [action[0] for action in actions[:-1]])
+            self.assertEqual(results[-1][1]["error"], "bad action")
+            for result in results[:-1]:
+                self.assertEqual(result[1]["version"], 2)
+
+            # a refused creation applies none of the actions either
+            response = client.post("/api/batch", json={
+                "create": {"ids": ["routedGame", created[0][0]]},
+                "actions": [[gameId, "pass"] for gameId, state in created]
+            })
+            self.assertEqual(response.status_code, 400)
+            results = client.post("/api/batch", json={
+                "actions": [[gameId, "dismissPass"]
+                            for gameId, state in created]
+            }).get_json()["results"]
+            for result in results:
+                self.assertEqual(result[1]["version"], 3)
+            self.assertEqual(sum(router.getCounts().values()), 46)
+
+            for player, page in zip(clients, pages):
+                # migrated games drop their predictions, any action renews
+                player.post("/dismissPass", data={"ok": ""})
+                unit = re.search(rb'name="unit" value="(\d+)"', page)
+                player.post("/play", data={"unit": unit.group(1).decode()})
+            response = client.get("/stats/speculation")
+            self.assertNotIn("Set-Cookie", response.headers)
+            report = response.get_json()
+            hits = 0
+            for shard in router.shards.values():
+                data = shard.call("request", "GET", "/stats/speculation",
+                                  [], b"")[2]
+                hits += json.loads(data)["hits"]
+            self.assertEqual(report["hits"], hits)
+            self.assertGreater(hits, 0)
+        finally:
+            router.close()
+
+
 def getScenarioTestSuit():
     suit = unittest.TestSuite()
     suit.addTest(TestBoardInteraction("testBasicUnitPlay"))
@@ -157,7 +800,38 @@ def getScenarioTestSuit():
     suit.addTest(TestBoardInteraction("testBoardClear"))
     suit.addTest(TestAI("testUnitOptions"))
     suit.addTest(TestAI("testMakeTurn"))
+    suit.addTest(TestAI("testFinishingSearch"))
     suit.addTest(TestCheats("testCheats"))
     suit.addTest(TestLabelers("testUnitLabeling"))
     suit.addTest(TestLabelers("rowLabeling"))
+    suit.addTest(TestConcurrentGames("testSingleGame"))
+    suit.addTest(TestConcurrentGames("testManyGames"))
+    suit.addTest(TestConcurrentGames("testPagesWithoutGames"))
+    suit.addTest(TestSpectators("testSharedRender"))
+    suit.addTest(TestSpectators("testConditionalRequest"))
+    suit.addTest(TestSpectators("testUnknownGame"))
+    suit.addTest(TestSpectators("testCookieHidden"))
+    suit.addTest(TestSpeculation("testRepliesPrepared"))
+    suit.addTest(TestSpeculation("testSameAsInline"))
+    suit.addTest(TestSpeculation("testQueuedPrediction"))
+    suit.addTest(TestSpeculation("testCheatingAISkipped"))
+    suit.addTest(TestSpeculation("testReport"))
+    suit.addTest(TestAutoResolve("testResolveRound"))
+    suit.addTest(TestAutoResolve("testOutsideOfRound"))
+    suit.addTest(TestAutoResolve("testBatchSummary"))
+    suit.addTest(TestAutoResolve("testFailingPolicy"))
+    suit.addTest(TestAutoResolve("testLoggedMatches"))
+    suit.addTest(TestAssets("testFingerprintedPage"))
+    suit.addTest(TestAssets("testEncodings"))
+    suit.addTest(TestAssets("testMissingAsset"))
+    suit.addTest(TestLocales("testAcceptLanguage"))
+    suit.addTest(TestLocales("testBatchLocale"))
+    suit.addTest(TestBatchApi("testPlayManyGames"))
+    suit.addTest(TestBatchApi("testErrors"))
+    suit.addTest(TestBatchApi("testRefusedActions"))
+    suit.addTest(TestBatchApi("testExistingGames"))
+    suit.addTest(TestLoad("testSmallLoad"))
+    suit.addTest(TestSharding("testGameMigration"))
+    suit.addTest(TestSharding("testHashRing"))
+    suit.addTest(TestSharding("testRouter"))
     return suit
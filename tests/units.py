@@ -1,5 +1,17 @@
+import os
+import tempfile
 import unittest
 import mechanics
+import simulation
+import calibration
+import catalog
+import gamelog
+import policy
+import profiling
+import random
+import streams
+import vecenv
+import numpy as np
 
 
 class TestCreators(unittest.TestCase):
@@ -98,6 +110,15 @@ class TestPlayerBasicMethods(unittest.TestCase):
                 self.assertEqual(inHand0, inHand)
             inHand = inHand0
 
+    def testPlayGain(self):
+        for i in range(mechanics.Player.deckSize):
+            self.player.drawCard()
+        for unit in self.player.deck:
+            sum = self.player.getSum()
+            gain = unit.getPlayGain()
+            unit.play()
+            self.assertEqual(self.player.getSum(), sum + gain)
+
     def testWinRound(self):
         roundsWon = self.player.winRound()
         for i in range(100):
@@ -106,6 +127,338 @@ class TestPlayerBasicMethods(unittest.TestCase):
             roundsWon = roundsWon0
 
 
+class TestRules(unittest.TestCase):
+    def setUp(self):
+        self.rules = mechanics.Rules(rows=50, roundWinCondition=3,
+                                     handSize=40, basicUnits=300,
+                                     firstUnique=60, secondUnique=40)
+        self.player = mechanics.Player("Test Player", 0, self.rules)
+        self.player.generateDeck(mechanics.DeckGenerator(self.rules))
+
+    def checkCounts(self):
+        inHand = 0
+        inDeck = 0
+        inGame = 0
+        for unit in self.player.deck:
+            if unit.condition == mechanics.ConditionType.inHand:
+                inHand += 1
+            elif unit.condition == mechanics.ConditionType.inDeck:
+                inDeck += 1
+            elif unit.condition == mechanics.ConditionType.inGame:
+                inGame += unit.strength
+        self.assertEqual(self.player.countUnits(), (inHand, inDeck))
+        self.assertEqual(len(self.player.hand), inHand)
+        self.assertEqual(self.player.getSum(), inGame)
+        self.assertEqual(self.player.getSum(),
+                         sum(row.sum for row in self.player.rows))
+
+    def testDeck(self):
+        self.assertEqual(len(self.player.deck), 400)
+        self.assertEqual(len(self.player.rows), 50)
+        self.checkCounts()
+
+    def testPlay(self):
+        for i in range(200):
+            if len(self.player.hand) > 0:
+                self.player.hand.units[i % len(self.player.hand)].play()
+            self.player.drawCard()
+            self.checkCounts()
+            if i % 25 == 24:
+                self.player.clearRows()
+                self.checkCounts()
+                self.assertEqual(self.player.getSum(), 0)
+
+
+class TestEvents(unittest.TestCase):
+    def setUp(self):
+        self.player = mechanics.Player("Test Player", 0)
+        self.player.generateDeck(mechanics.DeckGenerator())
+        self.events = list()
+        for eventType in range(mechanics.EventType.count):
+            self.player.events.subscribe(eventType, self.getHandler(eventType))
+
+    def getHandler(self, eventType):
+        def handler(player, subject):
+            self.events.append((eventType, player, subject))
+        return handler
+
+    def testEmittedEvents(self):
+        self.player.drawCard()
+        self.assertEqual(self.events[-1], (mechanics.EventType.cardDrawn,
+                                           self.player, self.player.deck[
+                                               mechanics.Player.handSize]))
+        unit = self.player.deck[0]
+        unit.play()
+        self.assertEqual(self.events[-1], (mechanics.EventType.cardPlayed,
+                                           self.player, unit))
+        self.player.winRound()
+        self.assertEqual(self.events[-1], (mechanics.EventType.roundWon,
+                                           self.player, 1))
+        self.player.clearRows()
+        self.assertEqual(self.events[-1][0], mechanics.EventType.rowsCleared)
+
+    def testUnsubscribe(self):
+        handler = self.getHandler(mechanics.EventType.cardDrawn)
+        events = mechanics.EventBus()
+        events.subscribe(mechanics.EventType.cardDrawn, handler)
+        events.unsubscribe(mechanics.EventType.cardDrawn, handler)
+        self.player.setEvents(events)
+        self.player.drawCard()
+        self.assertEqual(len(self.events), 0)
+
+
+class TestSimulation(unittest.TestCase):
+    def testMatch(self):
+        for i in range(20):
+            opponent = mechanics.AI("Test AI", i % 3)
+            match = simulation.createMatch(simulation.ReferencePolicy(),
+                                           opponent, i % 2)
+            result = match.play()
+            if result == 1:
+                self.assertEqual(match.player.roundsWon,
+                                 mechanics.roundWinCondition)
+            elif result == -1:
+                self.assertEqual(match.opponent.roundsWon,
+                                 mechanics.roundWinCondition)
+            else:
+                self.assertEqual(match.rounds, simulation.Match.maxRounds)
+
+    def testWilsonInterval(self):
+        low, high = calibration.getWilsonInterval(50, 100, 1.96)
+        self.assertLess(low, 0.5)
+        self.assertGreater(high, 0.5)
+        narrowLow, narrowHigh = calibration.getWilsonInterval(500, 1000,
+                                                              1.96)
+        self.assertLess(narrowHigh - narrowLow, high - low)
+
+
+class TestGameLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.writer = gamelog.ColumnarLogWriter(self.directory.name,
+                                                batchRows=16, rowsPerFile=64)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testRecordedMatches(self):
+        rounds = 0
+        for i in range(10):
+            match = simulation.createMatch(simulation.ReferencePolicy(),
+                                           mechanics.AI("Test AI", 1))
+            gamelog.GameRecorder(self.writer, i, match.player,
+                                 match.opponent, match.events, 1, 0)
+            match.play()
+            rounds += match.rounds
+        self.writer.close()
+
+        paths = sorted(os.listdir(self.directory.name))
+        self.assertGreater(len(paths), 1, "log files were not rotated")
+        recorded = 0
+        roundRows = 0
+        gameIds = set()
+        for path in paths:
+            reader = gamelog.ColumnarLogReader(
+                os.path.join(self.directory.name, path))
+            recorded += len(reader)
+            for types in reader.getColumn("recordType"):
+                roundRows += types.tolist().count(gamelog.RecordType.round)
+                types.release()
+            for column in reader.getColumn("gameId"):
+                gameIds.update(column.tolist())
+                column.release()
+            reader.close()
+        self.assertEqual(roundRows, rounds)
+        self.assertEqual(gameIds, set(range(10)))
+        self.assertGreater(recorded, roundRows)
+
+
+class TestPolicyTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "policy.bin")
+        policy.writeTable(self.path, {5: 1, 1: 0, 9: 3})
+        self.table = policy.PolicyTable(self.path)
+
+    def tearDown(self):
+        self.table.close()
+        self.directory.cleanup()
+
+    def testLookup(self):
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table.lookup(1), 0)
+        self.assertEqual(self.table.lookup(5), 1)
+        self.assertEqual(self.table.lookup(9), 3)
+        self.assertIsNone(self.table.lookup(0))
+        self.assertIsNone(self.table.lookup(7))
+        self.assertIsNone(self.table.lookup(10))
+
+    def testTablePolicyAI(self):
+        playerAI = policy.TablePolicyAI("Test AI", table=self.table)
+        opponent = mechanics.Player("Test Player", 0)
+        deckGenerator = mechanics.DeckGenerator()
+        playerAI.generateDeck(deckGenerator)
+        opponent.generateDeck(deckGenerator)
+        key = policy.getStateKey(playerAI, opponent.getSum(),
+                                 opponent.roundsWon, False)
+        unit = playerAI.hand.units[0]
+        policy.writeTable(self.path + "2",
+                          {key: policy.getAction(unit)})
+        playerAI.table = policy.PolicyTable(self.path + "2")
+        choice = playerAI.makeTurn(opponent)
+        self.assertEqual(policy.getBucket(choice), policy.getBucket(unit))
+        playerAI.table.close()
+
+
+class TestVectorEnv(unittest.TestCase):
+    def setUp(self):
+        self.env = vecenv.VectorEnv(64, difficulty=1, seed=1)
+        self.observations = self.env.reset()
+        self.random = np.random.default_rng(1)
+
+    def checkRowSums(self):
+        env = self.env
+        inGame = env.condition == mechanics.ConditionType.inGame
+        for row in range(mechanics.rows):
+            cards = inGame & (env.rowType == row)
+            commanders = cards & (env.kind == vecenv.Kind.commander)
+            bonus = commanders.sum(axis=2, keepdims=True) - commanders
+            expected = ((env.strength + bonus) * cards).sum(axis=2)
+            self.assertTrue((env.getRowSums()[:, :, row] == expected).all())
+
+    def testSteps(self):
+        finished = 0
+        for i in range(100):
+            hand = self.env.getActionMask()
+            keys = self.random.random(hand.shape)
+            keys[~hand] = -1
+            actions = np.where(hand.any(axis=1), keys.argmax(axis=1), -1)
+            observations, rewards, dones = self.env.step(actions)
+            self.assertEqual(observations.shape, self.observations.shape)
+            self.assertTrue((rewards[~dones] == 0).all())
+            self.assertTrue((self.env.deckTop <= 25).all())
+            self.checkRowSums()
+            finished += dones.sum()
+        self.assertGreater(finished, 0)
+
+
+class TestProfiling(unittest.TestCase):
+    def testRecordedCalls(self):
+        profiler = profiling.Profiler()
+        originals = [owner.__dict__[name] for owner, name in profiler.targets]
+        with profiler:
+            profiling.runMatches(5)
+        for (owner, name), original in zip(profiler.targets, originals):
+            self.assertIs(owner.__dict__[name], original)
+
+        self.assertEqual(profiler.counts["DeckGenerator.generateDeck"], 10)
+        self.assertGreater(profiler.counts["AI.makeTurn"], 0)
+        self.assertEqual(profiler.counts["AI.chooseTurn"],
+                         profiler.counts["AI.makeTurn"])
+        self.assertIn("AI.makeTurn;AI.chooseTurn",
+                      [line.rsplit(" ", 1)[0]
+                       for line in profiler.getCollapsedStacks()])
+        for line in profiler.getCollapsedStacks():
+            path, value = line.rsplit(" ", 1)
+            self.assertIn(path.split(";")[0], profiler.counts)
+            self.assertGreaterEqual(int(value), 0)
+
+        calls = profiler.counts["Unit.play"]
+        profiling.runMatches(5)
+        self.assertEqual(profiler.counts["Unit.play"], calls)
+
+    def testTableChoice(self):
+        playerAI = policy.TablePolicyAI("Profiled AI", 1)
+        playerAI.generateDeck(mechanics.DeckGenerator())
+        with profiling.Profiler() as profiler:
+            playerAI.chooseTurn(0, 0)
+        self.assertEqual(profiler.counts["TablePolicyAI.chooseTurn"], 1)
+        self.assertEqual([line.rsplit(" ", 1)[0]
+                          for line in profiler.getCollapsedStacks()],
+                         ["TablePolicyAI.chooseTurn",
+                          "TablePolicyAI.chooseTurn;AI.chooseTurn"])
+
+
+class TestStreams(unittest.TestCase):
+    def testKnownAnswers(self):
+        self.assertEqual(streams.getBlock((0, 0, 0, 0), (0, 0)),
+                         (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8))
+        ones = 0xFFFFFFFF
+        self.assertEqual(streams.getBlock((ones,) * 4, (ones, ones)),
+                         (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd))
+
+    def testDraws(self):
+        first = streams.getStream(0, "game", 1)
+        second = streams.getStream(0, "game", 1)
+        other = streams.getStream(0, "game", 2)
+        draws = [first.randint(1, 6) for i in range(1000)]
+        self.assertEqual(draws, [second.randint(1, 6) for i in range(1000)])
+        self.assertNotEqual(draws, [other.randint(1, 6) for i in range(1000)])
+        self.assertEqual(set(draws), {1, 2, 3, 4, 5, 6})
+        self.assertTrue(all(0 <= first.random() < 1 for i in range(1000)))
+        self.assertEqual(first.randint(3, 3), 3)
+        self.assertRaises(ValueError, first.randint, 2, 1)
+        self.assertRaises(ValueError, first.randbelow, 0)
+
+        cards = list(range(25))
+        first.shuffle(cards)
+        self.assertEqual(sorted(cards), list(range(25)))
+
+    def testIndependentOfWorkers(self):
+        params = (15, 5, 2, True)
+        whole = calibration.playBatch((7, 3, params, 0, 20))
+        random.seed(1)
+        first = calibration.playBatch((7, 3, params, 0, 8))
+        random.seed(2)
+        second = calibration.playBatch((7, 3, params, 8, 12))
+        self.assertEqual(whole, first + second)
+
+
+class TestCatalog(unittest.TestCase):
+    def testCompiledTemplates(self):
+        self.assertEqual(catalog.renumber("{}, {:>3} and {{}}", 2),
+                         "{2}, {3:>3} and {{}}")
+        with open("static/texts.txt", "r") as source:
+            lines = source.read().splitlines()
+        texts = catalog.compileCatalog(lines)
+        self.assertEqual(texts["aiLabel"].format(*range(6)),
+                         "<br>".join(lines[8:11]).format(*range(6)))
+        self.assertEqual(texts["playerLabel"].format(*range(5)),
+                         "<br>".join(lines[8:10]).format(*range(5)))
+        ending = [line + "<br>" for line in lines[16:20]]
+        message = (ending[0].format("a", "b") + ending[1].format(1, 2, "won")
+                   + ending[2].format("won") + ending[3])
+        self.assertEqual(texts["gameMessage"].format("a", "b", 1, 2, "won"),
+                         message)
+
+    def testCachedArtifact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "texts.txt")
+            with open("static/texts.txt", "r") as original:
+                lines = original.read().splitlines()
+            with open(source, "w") as copy:
+                copy.write("\n".join(lines))
+            build = os.path.join(directory, "build")
+            texts = catalog.loadCatalog("en", source, build)
+            artifact = os.path.join(build, "texts.en.json")
+            modified = os.stat(artifact).st_mtime_ns
+            catalog.loadCatalog("en", source, build)
+            self.assertEqual(os.stat(artifact).st_mtime_ns, modified)
+
+            lines[0] = "Player"
+            with open(source, "w") as copy:
+                copy.write("\n".join(lines))
+            changed = catalog.loadCatalog("en", source, build)
+            self.assertEqual(texts.playerNames[0], "You")
+            self.assertEqual(changed.playerNames[0], "Player")
+
+            # a file in place of the build directory makes it unwritable
+            blocked = os.path.join(directory, "blocked")
+            open(blocked, "w").close()
+            texts = catalog.loadCatalog("en", source, blocked)
+            self.assertEqual(texts.playerNames[0], "Player")
+
+
 def getUnitTestSuit():
     suit = unittest.TestSuite()
     suit.addTest(TestCreators("testCreators"))
@@ -113,5 +466,23 @@ def getUnitTestSuit():
     suit.addTest(TestDeckGeneration("testUnitNumbers"))
     suit.addTest(TestPlayerBasicMethods("testUnitCount"))
     suit.addTest(TestPlayerBasicMethods("testDrawCard"))
+    suit.addTest(TestPlayerBasicMethods("testPlayGain"))
     suit.addTest(TestPlayerBasicMethods("testWinRound"))
+    suit.addTest(TestRules("testDeck"))
+    suit.addTest(TestRules("testPlay"))
+    suit.addTest(TestEvents("testEmittedEvents"))
+    suit.addTest(TestEvents("testUnsubscribe"))
+    suit.addTest(TestSimulation("testMatch"))
+    suit.addTest(TestSimulation("testWilsonInterval"))
+    suit.addTest(TestGameLog("testRecordedMatches"))
+    suit.addTest(TestPolicyTable("testLookup"))
+    suit.addTest(TestPolicyTable("testTablePolicyAI"))
+    suit.addTest(TestVectorEnv("testSteps"))
+    suit.addTest(TestProfiling("testRecordedCalls"))
+    suit.addTest(TestProfiling("testTableChoice"))
+    suit.addTest(TestStreams("testKnownAnswers"))
+    suit.addTest(TestStreams("testDraws"))
+    suit.addTest(TestStreams("testIndependentOfWorkers"))
+    suit.addTest(TestCatalog("testCompiledTemplates"))
+    suit.addTest(TestCatalog("testCachedArtifact"))
     return suit
@@ -0,0 +1,228 @@
+import numpy as np
+import mechanics
+
+
+class Kind:
+    unit = 0
+    commander = 1
+    spy = 2
+
+
+class VectorEnv:
+    def __init__(self, count, difficulty=0, fraction=mechanics.Fraction.north,
+                 rules=None, seed=0):
+        self.count = count
+        self.difficulty = difficulty
+        self.fraction = fraction
+        self.rules = rules if rules is not None else mechanics.defaultRules
+        self.random = np.random.Generator(np.random.Philox(seed))
+        self.slots = np.arange(self.rules.deckSize)
+
+        # side 0 is the agent, side 1 is the built-in AI
+        cards = (count, 2, self.rules.deckSize)
+        rows = (count, 2, self.rules.rows)
+        self.strength = np.zeros(cards, np.int64)
+        self.rowType = np.zeros(cards, np.int64)
+        self.kind = np.zeros(cards, np.int8)
+        self.condition = np.zeros(cards, np.int8)
+        self.deckTop = np.zeros((count, 2), np.int64)
+        self.rowBase = np.zeros(rows, np.int64)
+        self.rowUnits = np.zeros(rows, np.int64)
+        self.rowCommanders = np.zeros(rows, np.int64)
+        self.roundsWon = np.zeros((count, 2), np.int64)
+        self.rounds = np.zeros(count, np.int64)
+        self.opponentPassed = np.zeros(count, bool)
+
+    def reset(self):
+        self.resetGames(np.arange(self.count))
+        return self.getObservations()
+
+    def resetGames(self, games):
+        if len(games) == 0:
+            return
+        basic = (len(games), self.rules.basicUnits)
+        basicStrength = self.generateStrength(basic, 3)
+        basicRows = self.random.integers(0, self.rules.rows, basic)
+        sides = [self.fraction, mechanics.Fraction.north]
+        for side in range(2):
+            self.generateDeck(games, side, sides[side], basicStrength,
+                              basicRows)
+        self.strength[games, 1] += self.random.integers(
+            0, self.difficulty + 2, (len(games), self.rules.deckSize)
+        )
+        self.clearRows(games)
+        self.roundsWon[games] = 0
+        self.rounds[games] = 0
+
+    def generateStrength(self, shape, factor):
+        return (self.random.integers(1, 3, shape) *
+                self.random.integers(1, factor + 1, shape) +
+                self.random.integers(1, 5, shape))
+
+    def generateDeck(self, games, side, fraction, basicStrength, basicRows):
+        rules = self.rules
+        first = (len(games), rules.firstUnique)
+        second = (len(games), rules.secondUnique)
+        if fraction == mechanics.Fraction.north:
+            firstKind, secondKind = Kind.commander, Kind.spy
+        else:
+            firstKind, secondKind = Kind.spy, Kind.commander
+        strength = np.concatenate([
+            basicStrength,
+            self.generateUniqueStrength(first, firstKind) + 2,
+            self.generateUniqueStrength(second, secondKind)
+        ], axis=1)
+        rowType = np.concatenate([
+            basicRows,
+            self.random.integers(0, rules.rows, first),
+            self.random.integers(0, rules.rows, second)
+        ], axis=1)
+        kind = np.concatenate([
+            np.full(basicStrength.shape, Kind.unit, np.int8),
+            np.full(first, firstKind, np.int8),
+            np.full(second, secondKind, np.int8)
+        ], axis=1)
+
+        order = np.argsort(self.random.random(strength.shape), axis=1)
+        self.strength[games, side] = np.take_along_axis(strength, order, 1)
+        self.rowType[games, side] = np.take_along_axis(rowType, order, 1)
+        self.kind[games, side] = np.take_along_axis(kind, order, 1)
+        condition = np.full(strength.shape, mechanics.ConditionType.inDeck,
+                            np.int8)
+        condition[:, :rules.handSize] = mechanics.ConditionType.inHand
+        self.condition[games, side] = condition
+        self.deckTop[games, side] = rules.handSize
+
+    def generateUniqueStrength(self, shape, kind):
+        if kind == Kind.commander:
+            return self.generateStrength(shape, 2)
+        return self.random.integers(1, 3, shape) * \
+            self.random.integers(1, 4, shape)
+
+    def clearRows(self, games):
+        condition = self.condition[games]
+        condition[condition == mechanics.ConditionType.inGame] = \
+            mechanics.ConditionType.dead
+        self.condition[games] = condition
+        self.rowBase[games] = 0
+        self.rowUnits[games] = 0
+        self.rowCommanders[games] = 0
+        self.opponentPassed[games] = False
+
+    def drawCards(self, games, side, amount):
+        top = self.deckTop[games, side]
+        newTop = np.minimum(top + amount, self.rules.deckSize)
+        drawn = (self.slots >= top[:, None]) & (self.slots < newTop[:, None])
+        condition = self.condition[games, side]
+        condition[drawn] = mechanics.ConditionType.inHand
+        self.condition[games, side] = condition
+        self.deckTop[games, side] = newTop
+
+    def playCards(self, games, side, cards):
+        rows = self.rowType[games, side, cards]
+        kinds = self.kind[games, side, cards]
+        self.condition[games, side, cards] = mechanics.ConditionType.inGame
+        # a game appears once per call, so fancy-indexed updates are safe
+        self.rowBase[games, side, rows] += self.strength[games, side, cards]
+        self.rowUnits[games, side, rows] += 1
+        self.rowCommanders[games, side, rows] += kinds == Kind.commander
+        self.drawCards(games[kinds == Kind.spy], side, 2)
+
+    def getRowSums(self):
+        # every unit is buffed by each commander in the row except itself
+        return self.rowBase + self.rowCommanders * (self.rowUnits - 1)
+
+    def getHand(self, games, side):
+        return self.condition[games, side] == mechanics.ConditionType.inHand
+
+    def chooseRandomCards(self, hand):
+        keys = self.random.random(hand.shape)
+        keys[~hand] = -1
+        return np.where(hand.any(axis=1), keys.argmax(axis=1), -1)
+
+    def makeAITurns(self, games, lastTurn):
+        sums = self.getRowSums()[games].sum(axis=2)
+        mySum = sums[:, 1]
+        opponentSum = sums[:, 0]
+        hand = self.getHand(games, 1)
+
+        # if opponent passed, then try to finish him
+        commanders = np.take_along_axis(self.rowCommanders[games, 1],
+                                        self.rowType[games, 1], 1)
+        added = self.strength[games, 1] + commanders
+        finishing = hand & (mySum[:, None] + added > opponentSum[:, None])
+        finish = np.where(finishing.any(axis=1), finishing.argmax(axis=1), -1)
+        finish[mySum > opponentSum] = -1
+
+        # otherwise possibly pass, or make a random turn
+        passing = mySum > opponentSum + mechanics.AI.strengthThreshold
+        early = self.roundsWon[games].max(axis=1) < \
+            self.rules.roundWinCondition - 1
+        passTry = self.random.integers(0, mechanics.AI.passRate + 1,
+                                       len(games))
+        passing |= early & (passTry == mechanics.AI.passRate)
+        regular = np.where(passing, -1, self.chooseRandomCards(hand))
+        return np.where(lastTurn, finish, regular)
+
+    def step(self, actions):
+        games = np.arange(self.count)
+        actions = np.asarray(actions, np.int64)
+        inRange = (actions >= 0) & (actions < self.rules.deckSize)
+        cards = np.where(inRange, actions, 0)
+        played = inRange & (self.condition[games, 0, cards] ==
+                            mechanics.ConditionType.inHand)
+        alreadyPassed = self.opponentPassed.copy()
+
+        self.playCards(games[played], 0, cards[played])
+
+        # the AI answers a played card, or makes its last turn after a pass
+        lastTurn = ~played & ~alreadyPassed
+        answering = games[(played & ~alreadyPassed) | lastTurn]
+        replies = self.makeAITurns(answering, lastTurn[answering])
+        replied = replies >= 0
+        self.playCards(answering[replied], 1, replies[replied])
+        passedNow = answering[~replied & ~lastTurn[answering]]
+        self.opponentPassed[passedNow] = True
+
+        rewards = np.zeros(self.count, np.float32)
+        dones = np.zeros(self.count, bool)
+        ended = games[~played | alreadyPassed]
+        if len(ended) > 0:
+            self.endRounds(ended, rewards, dones)
+        self.resetGames(games[dones])
+        return self.getObservations(), rewards, dones
+
+    def endRounds(self, games, rewards, dones):
+        sums = self.getRowSums()[games].sum(axis=2)
+        self.roundsWon[games, 0] += sums[:, 0] > sums[:, 1]
+        self.roundsWon[games, 1] += sums[:, 1] > sums[:, 0]
+        self.rounds[games] += 1
+
+        won = self.roundsWon[games, 0] >= self.rules.roundWinCondition
+        lost = self.roundsWon[games, 1] >= self.rules.roundWinCondition
+        finished = won | lost | (self.rounds[games] >= maxRounds)
+        rewards[games] = np.where(won, 1, np.where(lost, -1, 0))
+        dones[games] = finished
+
+        continuing = games[~finished]
+        self.drawCards(continuing, 0, 1)
+        self.drawCards(continuing, 1, 1)
+        self.clearRows(continuing)
+
+    def getActionMask(self):
+        return self.getHand(np.arange(self.count), 0)
+
+    def getObservations(self):
+        rowSums = self.getRowSums()
+        hand = self.getActionMask()
+        return np.concatenate([
+            rowSums[:, 0], rowSums[:, 1],
+            self.rowCommanders[:, 0], self.rowCommanders[:, 1],
+            self.roundsWon, self.opponentPassed[:, None],
+            hand, self.strength[:, 0] * hand, self.kind[:, 0] * hand,
+            self.rowType[:, 0] * hand
+        ], axis=1).astype(np.float32)
+
+
+# matches simulation.Match, ties may repeat once both decks are empty
+maxRounds = 10
@@ -1,48 +1,25 @@
 from abc import abstractmethod
+import assets
+import atexit
+import catalog
+import concurrent.futures
+import copy
 import flask
+import functools
+import gamelog
 import mechanics
 import os
-
-
-class Texts:
-    def __init__(self):
-        textSource = open("static/texts.txt", "r")
-        lines = textSource.read().splitlines()
-        iterator = iter(lines)
-        self.playerNames = list()
-        for i in range(2):
-            self.playerNames.append(next(iterator))
-
-        self.difficultyOptions = list()
-        for i in range(4):
-            self.difficultyOptions.append(next(iterator))
-        self.fractionOptions = list()
-        for i in range(2):
-            self.fractionOptions.append(next(iterator))
-
-        self.playerLabel = list()
-        for i in range(3):
-            self.playerLabel.append(next(iterator))
-
-        self.rowTypes = list()
-        for i in range(3):
-            self.rowTypes.append(next(iterator))
-
-        self.roundEnded = next(iterator)
-        self.gameEnded = next(iterator)
-
-        self.endingMessage = list()
-        for i in range(4):
-            self.endingMessage.append(next(iterator))
-        self.endingActions = list()
-        for i in range(3):
-            self.endingActions.append(next(iterator))
-        textSource.close()
+import policy
+import simulation
+import streams
+import threading
+import time
+import uuid
 
 
 class Labeler:
-    def __init__(self):
-        pass
+    def __init__(self, texts=None):
+        self.texts = texts if texts is not None else defaultTexts
 
     def getUnitLabel(self, unit):
         return str(unit.strength)
@@ -61,32 +38,30 @@ class Labeler:
 
     def getPlayerLabel(self, player):
         count = player.countUnits()
-        label = "<br>".join(texts.playerLabel[0:2])
-        return label.format(
-            player.name, texts.fractionOptions[player.fraction],
+        return self.texts.playerLabel.format(
+            player.name, self.texts.fractionOptions[player.fraction],
             player.roundsWon, count[0], count[1]
         )
 
     def getAILabel(self, playerAI):
         count = playerAI.countUnits()
-        label = "<br>".join(texts.playerLabel)
-        return label.format(
-            playerAI.name, texts.fractionOptions[playerAI.fraction],
+        return self.texts.aiLabel.format(
+            playerAI.name, self.texts.fractionOptions[playerAI.fraction],
             playerAI.roundsWon, count[0], count[1],
-            texts.difficultyOptions[playerAI.difficulty]
+            self.texts.difficultyOptions[playerAI.difficulty]
         )
 
 
 class ButtonLabeler(Labeler):
     def getUnitLabel(self, unit):
-        return texts.rowTypes[unit.rowType] + " " + str(unit.strength)
+        return self.texts.unitButtons[unit.rowType] + str(unit.strength)
 
     def getCommanderLabel(self, commander):
-        return ("commander " + texts.rowTypes[commander.rowType] + " " +
+        return (self.texts.commanderButtons[commander.rowType] +
                 str(commander.strength))
 
     def getSpyLabel(self, spy):
-        return "spy " + texts.rowTypes[spy.rowType] + " " + str(spy.strength)
+        return self.texts.spyButtons[spy.rowType] + str(spy.strength)
 
 
 class InterfaceElement:
@@ -101,12 +76,11 @@ class PlayerElement(InterfaceElement):
             self.player = manager.game.player1
         else:
             self.player = manager.game.player2
-        labeler = Labeler()
-        self.state = self.player.acceptLabeler(labeler)
+        self.labeler = Labeler(manager.game.texts)
+        self.state = self.player.acceptLabeler(self.labeler)
 
     def update(self):
-        labeler = Labeler()
-        self.state = self.player.acceptLabeler(labeler)
+        self.state = self.player.acceptLabeler(self.labeler)
 
 
 class RowsElement(InterfaceElement):
@@ -116,14 +90,14 @@ class RowsElement(InterfaceElement):
             self.player = manager.game.player1
         else:
             self.player = manager.game.player2
+        self.labeler = Labeler(manager.game.texts)
         self.rows = list("-" for i in range(mechanics.rows))
         self.rowSums = list(0 for i in range(mechanics.rows))
         self.sum = 0
 
     def update(self, rowType):
         row = self.player.rows[rowType]
-        labeler = Labeler()
-        self.rows[rowType] = row.acceptLabeler(labeler)
+        self.rows[rowType] = row.acceptLabeler(self.labeler)
         self.sum -= self.rowSums[rowType]
         self.rowSums[rowType] = row.sum
         self.sum += self.rowSums[rowType]
@@ -133,6 +107,7 @@ class UnitsElement(InterfaceElement):
     def __init__(self, manager):
         self.manager = manager
         self.player = manager.game.player1
+        self.labeler = ButtonLabeler(manager.game.texts)
         self.buttonLabels = list()
         self.update()
 
@@ -146,8 +121,10 @@ class UnitsElement(InterfaceElement):
 
     def addUnit(self, i):
         unit = self.player.deck[i]
-        buttonLabeler = ButtonLabeler()
-        self.buttonLabels.append(unit.acceptLabeler(buttonLabeler))
+        self.buttonLabels.append(unit.acceptLabeler(self.labeler))
+
+    def removeUnit(self, unit):
+        self.buttonLabels[self.player.deck.index(unit)] = None
 
 
 class InterfaceManager:
@@ -159,24 +136,67 @@ class InterfaceManager:
         self.rowsInterface2 = RowsElement(self, True)
         self.unitsInterface = UnitsElement(self)
 
-    def processUnit(self, index):
-        self.unitsInterface.buttonLabels[index] = None
-        self.playerInterface1.update()
-        rowType = self.game.player1.deck[index].rowType
-        self.rowsInterface1.update(rowType)
-        self.unitsInterface.update()
+        events = game.events
+        events.subscribe(mechanics.EventType.cardDrawn, self.onCardDrawn)
+        events.subscribe(mechanics.EventType.cardPlayed, self.onCardPlayed)
+        events.subscribe(mechanics.EventType.rowsCleared,
+                         self.onRowsCleared)
+        events.subscribe(mechanics.EventType.roundWon, self.onRoundWon)
+
+    def getElements(self, player):
+        if player is self.game.player1:
+            return self.playerInterface1, self.rowsInterface1
+        return self.playerInterface2, self.rowsInterface2
+
+    def onCardDrawn(self, player, unit):
+        playerInterface = self.getElements(player)[0]
+        playerInterface.update()
+        if player is self.game.player1:
+            self.unitsInterface.addUnit(player.deckTop - 1)
+
+    def onCardPlayed(self, player, unit):
+        playerInterface, rowsInterface = self.getElements(player)
+        playerInterface.update()
+        rowsInterface.update(unit.rowType)
+        if player is self.game.player1:
+            self.unitsInterface.removeUnit(unit)
+
+    def onRowsCleared(self, player, clearedRows):
+        rowsInterface = self.getElements(player)[1]
+        for i in clearedRows:
+            rowsInterface.update(i)
+
+    def onRoundWon(self, player, roundsWon):
+        self.getElements(player)[0].update()
+
+
+class TurnSummary:
+    def __init__(self, game):
+        self.game = game
+        self.turns = list()
+        self.labeler = ButtonLabeler(game.texts)
 
-    def processOppUnit(self, rowType):
-        self.playerInterface2.update()
-        self.rowsInterface2.update(rowType)
+    def watch(self):
+        self.game.events.subscribe(mechanics.EventType.cardPlayed,
+                                   self.onCardPlayed)
+        self.game.events.subscribe(mechanics.EventType.turnPassed,
+                                   self.onTurnPassed)
 
-    def updateAll(self):
-        self.playerInterface1.update()
-        self.playerInterface2.update()
-        for i in range(mechanics.rows):
-            self.rowsInterface1.update(i)
-            self.rowsInterface2.update(i)
-        self.unitsInterface.update()
+    def stopWatching(self):
+        self.game.events.unsubscribe(mechanics.EventType.cardPlayed,
+                                     self.onCardPlayed)
+        self.game.events.unsubscribe(mechanics.EventType.turnPassed,
+                                     self.onTurnPassed)
+
+    def addTurn(self, player, label):
+        self.turns.append((player.name, label, self.game.player1.getSum(),
+                           self.game.player2.getSum()))
+
+    def onCardPlayed(self, player, unit):
+        self.addTurn(player, unit.acceptLabeler(self.labeler))
+
+    def onTurnPassed(self, player, subject):
+        self.addTurn(player, None)
 
 
 class GameState:
@@ -190,105 +210,189 @@ class GameState:
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, gameId=None, texts=None):
+        self.gameId = gameId
+        # the cookie id controls the game, viewers get a separate token
+        self.spectatorId = uuid.uuid4().hex
+        self.texts = texts if texts is not None else defaultTexts
         self.state = GameState.configuringDifficulty
         self.manager = None
         self.difficulty = 0
         self.fraction = 0
         self.player1 = None
         self.player2 = None
+        self.events = None
         self.opponentPassed = False
         self.message = "OK, boomer"
+        self.lock = threading.Lock()
+        self.version = 0
+        self.spectatorPage = None
+        self.speculations = dict()
+        self.speculationVersion = -1
+        self.autoSummary = list()
+        self.matchId = None
+
+    def __getstate__(self):
+        # locks, predictions and cached pages belong to the hosting process
+        state = self.__dict__.copy()
+        del state["lock"]
+        state["speculations"] = dict()
+        state["speculationVersion"] = -1
+        state["spectatorPage"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
 
     def processDifficulty(self, choice):
         self.difficulty = choice
         self.state = GameState.configuringFraction
 
     def processFraction(self, choice):
+        if self.state != GameState.configuringFraction:
+            return
+        speculator.discard(self)
         self.fraction = choice
         self.state = GameState.playing
         self.startGame()
 
     def processUnit(self, index):
+        # a repeated request may refer to a unit which is already played
+        if self.state != GameState.playing or \
+                not 0 <= index < len(self.player1.deck) or \
+                self.player1.deck[index].condition != \
+                mechanics.ConditionType.inHand:
+            return
+        reply = speculator.takeReply(self, index)
         self.player1.deck[index].play()
-        self.manager.processUnit(index)
-        self.switchTurns()
+        self.switchTurns(reply)
 
     def processPass(self):
+        if self.state != GameState.playing:
+            return
+        speculator.discard(self)
+        self.events.emit(mechanics.EventType.turnPassed, self.player1)
         if not self.opponentPassed:
             self.opponentTurn(lastTurn=True)
         self.endRound()
 
     def startGame(self):
         self.state = GameState.playing
-        self.player1 = mechanics.Player(texts.playerNames[0], self.fraction)
-        self.player2 = mechanics.AI(texts.playerNames[1], self.difficulty)
-        if difficulty == 3:
+        self.autoSummary = list()
+        # one cookie plays many matches, each is logged under its own id
+        self.matchId = uuid.uuid4().hex
+        # the AI draws from its own stream, so speculation can fork it
+        aiRandom = streams.getStream(self.matchId, "ai")
+        names = self.texts.playerNames
+        self.player1 = mechanics.Player(
+            names[0], self.fraction,
+            rng=streams.getStream(self.matchId, "player")
+        )
+        if policyTable is not None and self.difficulty == 2:
+            self.player2 = policy.TablePolicyAI(
+                names[1], self.difficulty, table=policyTable, rng=aiRandom
+            )
+        else:
+            self.player2 = mechanics.AI(names[1], self.difficulty,
+                                        rng=aiRandom)
+        if self.difficulty == 3:
             self.player2 = mechanics.getCheatingAI(self.player2)
+        self.events = mechanics.EventBus()
+        self.player1.setEvents(self.events)
+        self.player2.setEvents(self.events)
         self.player1.generateDeck(deckGenerator)
         self.player2.generateDeck(deckGenerator)
         self.manager = InterfaceManager(self)
+        if gameLog is not None:
+            gamelog.GameRecorder(gameLog, self.matchId, self.player1,
+                                 self.player2, self.events, self.difficulty,
+                                 self.fraction)
 
-    def switchTurns(self):
+    def switchTurns(self, reply=None):
         if self.opponentPassed:
             self.endRound()
         else:
-            self.opponentTurn()
+            self.opponentTurn(reply=reply)
 
-    def opponentTurn(self, lastTurn=False):
-        unit = self.player2.makeTurn(self.player1, lastTurn)
+    def opponentTurn(self, lastTurn=False, reply=None):
+        if reply is None:
+            unit = self.player2.makeTurn(self.player1, lastTurn)
+        else:
+            unit = reply
         if unit != 0:
             unit.play()
-            self.manager.processOppUnit(unit.rowType)
-        elif not lastTurn:
+            return
+        self.events.emit(mechanics.EventType.turnPassed, self.player2)
+        if not lastTurn:
             self.opponentPassed = True
             self.state = GameState.notifyingPass
 
     def endRound(self):
+        self.events.emit(mechanics.EventType.roundEnded, self.player1)
         sum1 = self.player1.getSum()
         sum2 = self.player2.getSum()
-        lines = [line + "<br>" for line in texts.endingMessage]
-
         if self.opponentPassed:
-            lines[0] = lines[0].format(self.player2.name, self.player1.name)
+            names = (self.player2.name, self.player1.name)
         else:
-            lines[0] = lines[0].format(self.player1.name, self.player2.name)
+            names = (self.player1.name, self.player2.name)
         self.opponentPassed = False
 
         gameEnded = False
         if sum1 > sum2:
-            action = texts.endingActions[0]
+            action = self.texts.endingActions[0]
             roundsWon1 = self.player1.winRound()
-            if roundsWon1 == mechanics.roundWinCondition:
+            if roundsWon1 == self.player1.rules.roundWinCondition:
                 gameEnded = True
         elif sum1 == sum2:
-            action = texts.endingActions[1]
+            action = self.texts.endingActions[1]
         else:
-            action = texts.endingActions[2]
+            action = self.texts.endingActions[2]
             roundsWon2 = self.player2.winRound()
-            if roundsWon2 == mechanics.roundWinCondition:
+            if roundsWon2 == self.player2.rules.roundWinCondition:
                 gameEnded = True
-        lines[1] = lines[1].format(sum1, sum2, action)
 
         if gameEnded:
-            lines[2] = lines[2].format(action)
-            self.message = lines[0] + lines[1] + lines[2] + lines[3]
+            template = self.texts.gameMessage
             self.state = GameState.notifyingEndGame
         else:
-            self.message = lines[0] + lines[1] + lines[3]
+            template = self.texts.roundMessage
             self.state = GameState.notifyingEndRound
+        self.message = template.format(names[0], names[1], sum1, sum2, action)
+
+    def processAutoResolve(self, turnPolicy):
+        if self.state not in [GameState.playing, GameState.notifyingPass]:
+            return
+        speculator.discard(self)
+        summary = TurnSummary(self)
+        summary.watch()
+        try:
+            # every turn plays a unit or ends the round, so it is finite
+            while self.state in [GameState.playing, GameState.notifyingPass]:
+                self.state = GameState.playing
+                unit = turnPolicy.makeTurn(self.player1, self.player2,
+                                           self.opponentPassed)
+                if unit == 0:
+                    self.processPass()
+                else:
+                    unit.play()
+                    self.switchTurns()
+        finally:
+            summary.stopWatching()
+        self.autoSummary = summary.turns
 
     def processContinue(self):
+        speculator.discard(self)
+        self.autoSummary = list()
         if self.state == GameState.notifyingEndRound:
             self.state = GameState.playing
             self.newRound()
-        else:
+        elif self.state == GameState.notifyingEndGame:
             self.startGame()
 
     def clearBoard(self):
         self.player1.clearRows()
         self.player2.clearRows()
-        self.manager.updateAll()
 
     def newRound(self):
         self.player1.drawCard()
@@ -296,37 +400,399 @@ class Game:
         self.clearBoard()
 
 
-texts = Texts()
+class GameStorage:
+    def __init__(self):
+        self.games = dict()
+        self.spectators = dict()
+        self.lock = threading.Lock()
+
+    def getGame(self, gameId, texts=None):
+        with self.lock:
+            game = self.games.get(gameId)
+            if game is None:
+                game = Game(gameId, texts)
+                self.games[gameId] = game
+                self.spectators[game.spectatorId] = game
+            return game
+
+    def findGame(self, gameId):
+        with self.lock:
+            return self.games.get(gameId)
+
+    def findSpectated(self, spectatorId):
+        with self.lock:
+            return self.spectators.get(spectatorId)
+
+    def popGames(self, predicate):
+        with self.lock:
+            gameIds = [gameId for gameId in self.games if predicate(gameId)]
+            games = {gameId: self.games.pop(gameId) for gameId in gameIds}
+            for game in games.values():
+                del self.spectators[game.spectatorId]
+            return games
+
+    def addNewGames(self, gameIds, texts=None):
+        # all or nothing, a game in progress is never replaced
+        with self.lock:
+            if len(set(gameIds)) < len(gameIds) or \
+                    any(gameId in self.games for gameId in gameIds):
+                raise ValueError("games already exist")
+            created = [Game(gameId, texts) for gameId in gameIds]
+            for game in created:
+                self.games[game.gameId] = game
+                self.spectators[game.spectatorId] = game
+            return created
+
+    def addGames(self, games):
+        with self.lock:
+            self.games.update(games)
+            for game in games.values():
+                self.spectators[game.spectatorId] = game
+
+
+def predictReply(playerAI, opponentSum, opponentRoundsWon):
+    # a copy with a forked stream, the AI itself is never touched here
+    shadow = copy.copy(playerAI)
+    shadow.rng = copy.copy(playerAI.rng)
+    start = time.perf_counter()
+    unit = shadow.chooseTurn(opponentSum, opponentRoundsWon)
+    return unit, shadow.rng, time.perf_counter() - start
+
+
+class Speculator:
+    def __init__(self, workers=2):
+        self.executor = None
+        if workers > 0:
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.savedTime = 0.0
+
+    def speculate(self, game):
+        # called under the game lock once a request has changed the game
+        self.discard(game)
+        if self.executor is None or game.state != GameState.playing or \
+                game.opponentPassed or \
+                not isinstance(game.player2, mechanics.AI) or \
+                not isinstance(game.player2.rng, streams.PhiloxRandom):
+            return
+        # the AI only sees the player's sum, so one reply per unit in hand
+        opponentSum = game.player1.getSum()
+        opponentRoundsWon = game.player1.roundsWon
+        for index, unit in enumerate(game.player1.deck):
+            if unit.condition == mechanics.ConditionType.inHand:
+                game.speculations[index] = self.executor.submit(
+                    predictReply, game.player2,
+                    opponentSum + unit.getPlayGain(), opponentRoundsWon
+                )
+        game.speculationVersion = game.version
+
+    def takeReply(self, game, index):
+        if game.opponentPassed or not isinstance(game.player2, mechanics.AI):
+            return None
+        # nothing is predicted for bot API calls or with the pool disabled
+        if game.speculationVersion != game.version:
+            self.discard(game)
+            return None
+        future = game.speculations.pop(index, None)
+        # a prediction queued behind other games is faster to make inline
+        if future is not None and future.cancel():
+            future = None
+        self.discard(game)
+        if future is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        waitStart = time.perf_counter()
+        unit, rng, elapsed = future.result()
+        waited = time.perf_counter() - waitStart
+        # the fork drew exactly what the inline call would have drawn
+        game.player2.rng = rng
+        with self.lock:
+            self.hits += 1
+            self.savedTime += elapsed - waited
+        return unit
+
+    def discard(self, game):
+        # running predictions read the AI, so they finish before it changes
+        futures = list(game.speculations.values())
+        game.speculations = dict()
+        game.speculationVersion = -1
+        # a cancelled future only counts as done once a worker reaches it
+        running = [future for future in futures if not future.cancel()]
+        concurrent.futures.wait(running)
+
+    def getReport(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total > 0 else 0.0,
+                "savedMs": self.savedTime * 1e3
+            }
+
+
+def encodeState(game):
+    state = {"state": game.state, "version": game.version}
+    if game.player1 is None:
+        return state
+    state["sums"] = [game.player1.getSum(), game.player2.getSum()]
+    state["rounds"] = [game.player1.roundsWon, game.player2.roundsWon]
+    state["passed"] = game.opponentPassed
+    state["rows"] = [[row.sum for row in player.rows]
+                     for player in [game.player1, game.player2]]
+    # hand entries are deck index, card kind, row and strength
+    state["hand"] = [
+        [index, gamelog.getCardKind(unit), unit.rowType, unit.strength]
+        for index, unit in enumerate(game.player1.deck)
+        if unit.condition == mechanics.ConditionType.inHand
+    ]
+    state["opponentHand"] = game.player2.countUnits()[0]
+    # turns of the last auto resolve: player, label and both sums
+    state["autoSummary"] = game.autoSummary
+    return state
+
+
+def applyAction(game, action, argument):
+    if action == "play":
+        game.processUnit(int(argument))
+    elif action == "pass":
+        game.processPass()
+    elif action == "dismissPass":
+        if game.state == GameState.notifyingPass:
+            game.state = GameState.playing
+    elif action == "autoResolve":
+        turnPolicy = autoPolicies.get(argument)
+        if turnPolicy is None:
+            return False
+        game.processAutoResolve(turnPolicy)
+    elif action == "continue":
+        game.processContinue()
+    else:
+        return False
+    return True
+
+
+def createGames(request):
+    difficulty = int(request.get("difficulty", 0))
+    fraction = int(request.get("fraction", 0))
+    locale = request.get("locale", catalog.defaultLocale)
+    gameIds = request.get("ids")
+    if gameIds is None:
+        # the limit is checked before any id is made
+        count = int(request.get("count", 1))
+        if not 0 <= count <= maxBatch:
+            raise ValueError("bad game count")
+        gameIds = [uuid.uuid4().hex for i in range(count)]
+    elif not isinstance(gameIds, list) or \
+            not all(isinstance(gameId, str) for gameId in gameIds):
+        raise ValueError("ids must be a list of strings")
+    if not 0 <= difficulty <= 3 or not 0 <= fraction <= 1 or \
+            len(gameIds) > maxBatch or not isinstance(locale, str):
+        raise ValueError("bad game creation request")
+    created = list()
+    for game in games.addNewGames(gameIds, catalog.getCatalog(locale)):
+        with game.lock:
+            game.processDifficulty(difficulty)
+            game.processFraction(fraction)
+            game.version += 1
+            created.append([game.gameId, encodeState(game)])
+    return created
+
+
+def checkActions(actions):
+    # malformed entries only fail themselves, the batch needs a sane shape
+    if not isinstance(actions, list):
+        raise ValueError("actions must be a list")
+    if len(actions) > maxBatch:
+        raise ValueError("too many actions")
+
+
+def applyActions(actions):
+    results = list()
+    for entry in actions:
+        if not isinstance(entry, list) or len(entry) < 2:
+            results.append([None, {"error": "bad action"}])
+            continue
+        gameId, action = str(entry[0]), entry[1]
+        argument = entry[2] if len(entry) > 2 else None
+        game = games.findGame(gameId)
+        if game is None:
+            results.append([gameId, {"error": "unknown game"}])
+            continue
+        # one game at a time, so batches never wait on each other's locks
+        with game.lock:
+            try:
+                applied = applyAction(game, action, argument)
+            except (TypeError, ValueError):
+                applied = False
+            if not applied:
+                results.append([gameId, {"error": "bad action"}])
+                continue
+            game.version += 1
+            results.append([gameId, encodeState(game)])
+    return results
+
+
+def getRequestTexts():
+    locale = flask.request.accept_languages.best_match(list(catalogs))
+    return catalog.getCatalog(locale or catalog.defaultLocale)
+
+
+def gameAction(handler):
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        gameId = flask.request.cookies.get("gameId")
+        posted = flask.request.method == "POST"
+        newGame = gameId is None and posted
+        if newGame:
+            gameId = uuid.uuid4().hex
+        if posted:
+            game = games.getGame(gameId, getRequestTexts())
+        else:
+            # pages alone do not store games, crawlers would pile them up
+            game = games.findGame(gameId) or Game(texts=getRequestTexts())
+        # actions on one game are serialized, different games run in parallel
+        with game.lock:
+            response = flask.make_response(handler(game, *args, **kwargs))
+            if posted:
+                game.version += 1
+                speculator.speculate(game)
+        if newGame:
+            response.set_cookie("gameId", gameId, httponly=True)
+        return response
+    return wrapper
+
+
 gwentWeb = flask.Flask(__name__)
+catalogs = catalog.loadCatalogs(os.path.join(gwentWeb.root_path, "static"),
+                                os.path.join(gwentWeb.root_path, "build"))
+defaultTexts = catalogs[catalog.defaultLocale]
+assetPipeline = assets.AssetPipeline(
+    os.path.join(gwentWeb.root_path, "static")
+).build()
+gwentWeb.add_template_global(assetPipeline.getUrl, "asset")
 deckGenerator = mechanics.DeckGenerator()
-gwentGame = Game()
+games = GameStorage()
+speculator = Speculator(int(os.environ.get("GWENT_SPECULATION_WORKERS", 2)))
+maxBatch = 1000
+autoPolicies = {
+    "reference": simulation.ReferencePolicy(),
+    "random": simulation.RandomPolicy(),
+    "pass": simulation.PassPolicy()
+}
+gameLog = None
+if "GWENT_GAME_LOG" in os.environ:
+    gameLog = gamelog.ColumnarLogWriter(
+        os.environ["GWENT_GAME_LOG"],
+        os.environ.get("GWENT_GAME_LOG_PREFIX", "games")
+    )
+    atexit.register(gameLog.close)
+policyTable = None
+if "GWENT_POLICY_TABLE" in os.environ:
+    policyTable = policy.getTable(os.environ["GWENT_POLICY_TABLE"])
 if __name__ == '__main__':
     gwentWeb.run()
 
 
+def sendAsset(asset, cacheControl):
+    data, encoding = asset.getVariant(
+        flask.request.headers.get("Accept-Encoding")
+    )
+    response = flask.make_response(data)
+    response.mimetype = asset.mimetype
+    response.headers["Cache-Control"] = cacheControl
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+        response.set_etag("{}-{}".format(asset.digest, encoding))
+    else:
+        response.set_etag(asset.digest)
+    return response.make_conditional(flask.request)
+
+
 @gwentWeb.route("/favicon.ico")
 def favicon():
-    return flask.send_from_directory(
-        os.path.join(gwentWeb.root_path, "static"),
-        "icon.ico"
-    )
+    # browsers ask for this name directly, so it can not be immutable
+    return sendAsset(assetPipeline.assets["icon.ico"], "public, max-age=86400")
+
+
+@gwentWeb.route("/assets/<fileName>")
+def assetFile(fileName):
+    asset = assetPipeline.findFile(fileName)
+    if asset is None:
+        flask.abort(404)
+    return sendAsset(asset, assets.immutable)
 
 
 @gwentWeb.route("/", methods=["GET"])
-def get():
+@gameAction
+def get(game):
     labels = list()
-    if gwentGame.state == GameState.playing:
-        labels = gwentGame.manager.unitsInterface.buttonLabels
+    if game.state == GameState.playing:
+        labels = game.manager.unitsInterface.buttonLabels
     return flask.render_template(
         "index.html",
-        game=gwentGame,
-        manager=gwentGame.manager,
-        buttons=zip(range(len(labels)), labels)
+        game=game,
+        manager=game.manager,
+        buttons=zip(range(len(labels)), labels),
+        spectator=False
     )
 
 
+@gwentWeb.route("/spectate/<spectatorId>", methods=["GET"])
+def spectate(spectatorId):
+    game = games.findSpectated(spectatorId)
+    if game is None:
+        flask.abort(404)
+    # all viewers share one render per game version
+    page = game.spectatorPage
+    if page is None or page[0] != game.version:
+        with game.lock:
+            page = game.spectatorPage
+            if page is None or page[0] != game.version:
+                page = (game.version, flask.render_template(
+                    "index.html",
+                    game=game,
+                    manager=game.manager,
+                    buttons=list(),
+                    spectator=True
+                ))
+                game.spectatorPage = page
+    response = flask.make_response(page[1])
+    response.set_etag("{}-{}".format(spectatorId, page[0]))
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(flask.request)
+
+
+@gwentWeb.route("/api/batch", methods=["POST"])
+def apiBatch():
+    request = flask.request.get_json(silent=True)
+    if not isinstance(request, dict):
+        return flask.jsonify({"error": "a JSON object is expected"}), 400
+    try:
+        # a refused batch must not leave its created games behind
+        actions = request.get("actions", list())
+        checkActions(actions)
+        created = list()
+        if "create" in request:
+            created = createGames(request["create"])
+        results = applyActions(actions)
+    except (ValueError, TypeError, AttributeError) as error:
+        return flask.jsonify({"error": str(error)}), 400
+    return flask.jsonify({"created": created, "results": results})
+
+
+@gwentWeb.route("/stats/speculation", methods=["GET"])
+def speculationStats():
+    return flask.jsonify(speculator.getReport())
+
+
 @gwentWeb.route("/difficulty", methods=["POST"])
-def difficulty():
+@gameAction
+def difficulty(game):
     choice = 0
     if "medium" in flask.request.form:
         choice = 1
@@ -334,57 +800,77 @@ def difficulty():
         choice = 2
     elif "cheater" in flask.request.form:
         choice = 3
-    gwentGame.processDifficulty(choice)
+    game.processDifficulty(choice)
     return flask.redirect("/")
 
 
 @gwentWeb.route("/fraction", methods=["POST"])
-def fraction():
+@gameAction
+def fraction(game):
     choice = 0
     if "nilfgaard" in flask.request.form:
         choice = 1
-    gwentGame.processFraction(choice)
+    game.processFraction(choice)
     return flask.redirect("/")
 
 
 @gwentWeb.route("/play", methods=["POST"])
-def play():
+@gameAction
+def play(game):
     index = int(flask.request.form["unit"])
-    gwentGame.processUnit(index)
+    game.processUnit(index)
     return flask.redirect("/")
 
 
 @gwentWeb.route("/restart", methods=["POST"])
-def restart():
-    gwentGame.state = GameState.configuringDifficulty
+@gameAction
+def restart(game):
+    game.state = GameState.configuringDifficulty
     return flask.redirect("/")
 
 
 @gwentWeb.route("/rules", methods=["POST"])
-def rules():
-    gwentGame.state = GameState.displayingRules
+@gameAction
+def rules(game):
+    if game.state == GameState.playing:
+        game.state = GameState.displayingRules
     return flask.redirect("/")
 
 
 @gwentWeb.route("/dismissRules", methods=["POST"])
-def dismissRules():
-    gwentGame.state = GameState.playing
+@gameAction
+def dismissRules(game):
+    if game.state == GameState.displayingRules:
+        game.state = GameState.playing
     return flask.redirect("/")
 
 
 @gwentWeb.route("/pass", methods=["POST"])
-def passRound():
-    gwentGame.processPass()
+@gameAction
+def passRound(game):
+    game.processPass()
     return flask.redirect("/")
 
 
 @gwentWeb.route("/dismissPass", methods=["POST"])
-def dismissPass():
-    gwentGame.state = GameState.playing
+@gameAction
+def dismissPass(game):
+    if game.state == GameState.notifyingPass:
+        game.state = GameState.playing
+    return flask.redirect("/")
+
+
+@gwentWeb.route("/autoResolve", methods=["POST"])
+@gameAction
+def autoResolve(game):
+    turnPolicy = autoPolicies.get(flask.request.form.get("policy"))
+    if turnPolicy is not None:
+        game.processAutoResolve(turnPolicy)
     return flask.redirect("/")
 
 
 @gwentWeb.route("/continue", methods=["POST"])
-def continuePlaying():
-    gwentGame.processContinue()
+@gameAction
+def continuePlaying(game):
+    game.processContinue()
     return flask.redirect("/")